@@ -1,26 +1,80 @@
 from flask import Flask, flash, render_template, redirect, abort, url_for, \
-    request
+    request, make_response, Response, g, before_render_template, \
+    template_rendered, send_from_directory, jsonify
 from flask_ckeditor import CKEditor
 from flask_login import current_user, login_user, LoginManager, logout_user, \
     login_required
 from flask_wtf import CSRFProtect
+from datetime import datetime, timezone
+from functools import wraps
+import hashlib
 import os
+import time
+import mimetypes
 from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from assets import COMPRESSED_EXTENSIONS, asset_version, compress_assets, \
+    compressed_asset, compress_response
+from cache import create_page_cache
 import config
 from content import rating_to_star
 from database import Database
+import metrics
 from forms import LoginForm, RegisterForm, WriteForm, SearchForm
-from search import create_search_index, ft_search
+from jobs import job_queue
+from limits import BoundedExecutor, RateLimiter
+from search import ft_search, get_index_generation
+from suggest import SuggestionIndex
 
 
 app = Flask(__name__)
 csrf = CSRFProtect()
 db = Database()
 ckeditor = CKEditor(app)
+page_cache = create_page_cache()
+auth_limiter = RateLimiter(config.AUTH_RATE, config.AUTH_BURST)
+hash_workers = max(1, min(config.HASH_WORKERS, config.THREADS - 1))
+hash_executor = BoundedExecutor(hash_workers, max(0, min(
+    config.HASH_QUEUE, config.THREADS - 1 - hash_workers)))
+compress_assets(app.static_folder)
+suggestions = SuggestionIndex(db.get_items)
+suggestions.build()
+ASSET_VERSION = asset_version(app.static_folder)
+TEMPLATE_VERSION = asset_version(os.path.join(app.root_path,
+                                              app.template_folder))
+
+
+def load_secret_key():
+    """
+    Loads the secret key shared by all processes, creates it if there is
+    none yet.
 
-app.secret_key = os.urandom(32)
+    Returns:
+    bytes: the secret key
+    """
+    if not os.path.exists(config.SECRET_KEY_FILE):
+        tmp_path = config.SECRET_KEY_FILE + "." + str(os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as file:
+            file.write(os.urandom(32))
+        try:
+            os.link(tmp_path, config.SECRET_KEY_FILE)
+        except FileExistsError:
+            # another process created the key first
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(config.SECRET_KEY_FILE, "rb") as file:
+        return file.read()
+
+
+app.secret_key = load_secret_key()
 csrf.init_app(app)
+if config.PROXY_COUNT > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=config.PROXY_COUNT,
+                            x_proto=config.PROXY_COUNT)
 
 login = LoginManager(app)
 login.login_view = "login"
@@ -37,12 +91,90 @@ def load_user(ident):
     Returns:
     User: user that matches the id, None if none matches the id
     """
-    user = db.get_user_by_id(ident)
+    try:
+        user = db.get_user_by_id(int(ident))
+    except ValueError:
+        return None
     if user is not None:
         return user
     return None
 
 
+@app.before_request
+def start_request():
+    """
+    Starts collecting the metrics of the request.
+    """
+    g.start_time = time.perf_counter()
+    metrics.request_stats.start()
+
+
+@app.after_request
+def record_request(response):
+    """
+    Records the metrics of the request and logs it if it was slow.
+
+    Parameters:
+    response(Response): response to the request
+
+    Returns:
+    Response: the unchanged response
+    """
+    start = g.get("start_time")
+    if start is None:
+        # an earlier before_request handler like CSRFProtect aborted it
+        return compress_response(response, request.accept_encodings)
+    duration = time.perf_counter() - start
+    endpoint = request.endpoint or "none"
+    stats = metrics.request_stats
+    metrics.REQUESTS.inc(1, endpoint, str(response.status_code))
+    metrics.REQUEST_TIME.observe(duration, endpoint)
+    metrics.QUERY_TIME.observe(stats.query_time(), endpoint)
+    metrics.QUERY_COUNT.observe(len(stats.queries), endpoint)
+    response = compress_response(response, request.accept_encodings)
+    if config.SLOW_REQUEST_TIME is not None and \
+            duration > config.SLOW_REQUEST_TIME:
+        app.logger.warning(
+            "Slow request %s %s took %.3fs with %d queries (%.3fs) and %d "
+            "connections:\n%s", request.method, request.full_path, duration,
+            len(stats.queries), stats.query_time(), stats.connections,
+            "\n".join("%.4fs %s" % (query_time, query) for query, query_time
+                      in sorted(stats.queries, key=lambda q: -q[1])))
+    return response
+
+
+@before_render_template.connect_via(app)
+def start_template(sender, template, context, **extra):
+    """
+    Starts measuring the rendering time of a template.
+    """
+    g.template_start = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def record_template(sender, template, context, **extra):
+    """
+    Records the rendering time of a template.
+    """
+    start = g.pop("template_start", None)
+    if start is not None:
+        metrics.TEMPLATE_TIME.observe(time.perf_counter() - start,
+                                      template.name)
+
+
+@app.teardown_appcontext
+def close_db(exception):
+    """
+    Closes the database connection used by the request and stops collecting
+    its metrics.
+
+    Parameters:
+    exception(Exception): exception that ended the request, if any
+    """
+    db.close()
+    metrics.request_stats.reset()
+
+
 @app.context_processor
 def inject_title():
     """
@@ -53,7 +185,123 @@ def inject_title():
     """
     return dict(title=config.TITLE, style=config.STYLE,
                 description=config.DESCRIPTION,
-                registration=config.ALLOW_REGISTRATION, r_to_star=rating_to_star)
+                registration=config.ALLOW_REGISTRATION,
+                r_to_star=rating_to_star, asset_url=asset_url)
+
+
+def asset_url(filename):
+    """
+    Returns the versioned url of a static file.
+
+    Parameters:
+    filename(str): path of the file in the static folder
+
+    Returns:
+    str: url that changes whenever a static file changes
+    """
+    return url_for("asset", version=ASSET_VERSION, filename=filename)
+
+
+def conditional_page(view):
+    """
+    Decorates a view to answer conditional requests.
+    The ETag is derived from the newest entry, the number of deletions, the
+    request and the versions of the assets and templates, matching
+    If-None-Match or If-Modified-Since headers are answered with 304 without
+    rendering the page.
+
+    Parameters:
+    view(function): view that renders the page
+
+    Returns:
+    function: view that answers conditional requests
+    """
+    @wraps(view)
+    def conditional_view(*args, **kwargs):
+        max_id, newest, deletions, modified = db.get_content_state()
+        etag = hashlib.sha1(repr((
+            max_id, newest, deletions, request.full_path, config.STYLE,
+            current_user.get_id(), ASSET_VERSION,
+            TEMPLATE_VERSION)).encode()).hexdigest()
+        if modified is not None:
+            last_modified = datetime.fromtimestamp(modified, timezone.utc)
+        elif newest is not None:
+            last_modified = datetime.strptime(newest, "%Y-%m-%d").replace(
+                tzinfo=timezone.utc)
+        else:
+            last_modified = None
+        if is_resource_modified(request.environ, etag=etag,
+                                last_modified=last_modified):
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        else:
+            response = Response(status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+        return response
+    return conditional_view
+
+
+def cached_page(view):
+    """
+    Decorates a view to serve anonymous requests from the page cache.
+    Pages are cached by route, arguments, theme, content generation and the
+    versions of the assets and templates, so they are invalidated whenever
+    an entry is written or deleted or the blog is updated.
+
+    Parameters:
+    view(function): view that renders the page
+
+    Returns:
+    function: view that uses the cache
+    """
+    @wraps(view)
+    def cached_view(*args, **kwargs):
+        if page_cache is None or current_user.is_authenticated:
+            return view(*args, **kwargs)
+        key = (db.get_generation(), request.path,
+               tuple(sorted(request.args.items(multi=True))), config.STYLE,
+               ASSET_VERSION, TEMPLATE_VERSION)
+        page = page_cache.get(key)
+        if page is not None:
+            return Response(page[0], mimetype=page[1])
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            page_cache.set(key, (response.get_data(), response.mimetype))
+        return response
+    return cached_view
+
+
+def paginate(entries, before, after):
+    """
+    Trims a page that was fetched with one additional entry and determines
+    the cursors of its neighbouring pages.
+
+    Parameters:
+    entries(List(Entry)): entries of the page and one additional entry
+    before(int): cursor the page was requested with, None if there is none
+    after(int): cursor the page was requested with, None if there is none
+
+    Returns:
+    tuple: entries of the page, cursor of the previous and the next page or
+        None if there is no such page
+    """
+    more = len(entries) > config.PAGE_SIZE
+    if after is not None:
+        entries = entries[len(entries) - config.PAGE_SIZE:] if more \
+            else entries
+        has_prev, has_next = more, True
+    else:
+        entries = entries[:config.PAGE_SIZE]
+        has_prev, has_next = before is not None, more
+    if entries == []:
+        return entries, None, None
+    prev_cursor = entries[0].id if has_prev else None
+    next_cursor = entries[-1].id if has_next else None
+    return entries, prev_cursor, next_cursor
 
 
 @app.errorhandler(HTTPException)
@@ -68,6 +316,8 @@ def page_not_found(e):
 
 
 @app.route("/")
+@conditional_page
+@cached_page
 def index():
     """
     Renders the index page.
@@ -75,12 +325,17 @@ def index():
     Returns:
     str: html formatted index page
     """
-    entries = db.get_entries()
-    entries.reverse()
-    return render_template("index.html", entries=entries)
+    before = request.args.get("before", type=int)
+    after = request.args.get("after", type=int)
+    entries = db.get_entries_page(before, after, config.PAGE_SIZE + 1)
+    entries, prev_cursor, next_cursor = paginate(entries, before, after)
+    return render_template("index.html", entries=entries,
+                           prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 
 @app.route("/archive")
+@conditional_page
+@cached_page
 def archive():
     """
     Renders the archive page.
@@ -88,15 +343,12 @@ def archive():
     Returns:
     str: html formatted archive page
     """
-    entries = db.get_entries()
-    entries.sort(key=lambda y: y.item.name)
-    entries.reverse()
-    entries.sort(key=lambda y: y.item.date)
-    entries.reverse()
-    return render_template("archive.html", entries=entries)
+    return render_template("archive.html", archive=db.get_archive())
 
 
 @app.route("/user/<name>")
+@conditional_page
+@cached_page
 def user(name):
     """
     Renders the user page of a specific user.
@@ -107,17 +359,61 @@ def user(name):
     Returns:
     str: html formatted user page
     """
-    entries = db.get_entries_by_username(name)
-    entries.sort(key=lambda y: y.item.name)
-    entries.reverse()
-    entries.sort(key=lambda y: y.item.date)
-    entries.reverse()
+    before = request.args.get("before", type=int)
+    after = request.args.get("after", type=int)
+    entries = db.get_entries_by_username_page(name, before, after,
+                                              config.PAGE_SIZE + 1)
+    entries, prev_cursor, next_cursor = paginate(entries, before, after)
     if entries != []:
-        return render_template("user.html", name=name, entries=entries)
+        return render_template("user.html", name=name,
+                               archive=db.group_entries(entries),
+                               prev_cursor=prev_cursor,
+                               next_cursor=next_cursor)
     abort(404)
 
 
+@app.route("/item/<ident>")
+@conditional_page
+@cached_page
+def item(ident):
+    """
+    Renders the item page with the aggregated ratings and the entries of a
+    specific item.
+
+    Parameters:
+    ident(str): ident of the item
+
+    Returns:
+    str: html formatted item page
+    """
+    item = db.get_item_by_id(ident)
+    if item is None:
+        abort(404)
+    before = request.args.get("before", type=int)
+    after = request.args.get("after", type=int)
+    entries = db.get_entries_by_item_page(item.id, before, after,
+                                          config.PAGE_SIZE + 1)
+    entries, prev_cursor, next_cursor = paginate(entries, before, after)
+    return render_template("item.html", item=item, entries=entries,
+                           prev_cursor=prev_cursor, next_cursor=next_cursor)
+
+
+@app.route("/top")
+@conditional_page
+@cached_page
+def top():
+    """
+    Renders the page of the items with the best average rating.
+
+    Returns:
+    str: html formatted top rated page
+    """
+    return render_template("top.html",
+                           items=db.get_top_items(config.TOP_NUMBER))
+
+
 @app.route("/entry/<ident>")
+@conditional_page
 def entry(ident):
     """
     Renders the entry page of a specific entry.
@@ -135,6 +431,8 @@ def entry(ident):
 
 
 @app.route("/feed")
+@conditional_page
+@cached_page
 def feed():
     """
     Renders the rss feed of a the feed.
@@ -142,26 +440,115 @@ def feed():
     Returns:
     str: xml formatted feed
     """
-    entries = db.get_entries()
-    entries.reverse()
+    entries = db.get_entries_page(number=config.FEED_NUMBER, text=False,
+                                  plain=True)
     rss_xml = render_template("rss.xml", entries=entries)
     return rss_xml
 
 
+@app.route("/assets/<version>/<path:filename>")
+def asset(version, filename):
+    """
+    Returns a static file, precompressed if the client accepts it.
+    Files requested with the current version never change and are cached
+    indefinitely, outdated versions are served like unversioned files.
+
+    Parameters:
+    version(str): version of the static files
+    filename(str): path of the file in the static folder
+
+    Returns:
+    Response: the static file
+    """
+    current = version == ASSET_VERSION
+    encoding, path = compressed_asset(app.static_folder, filename,
+                                      request.accept_encodings)
+    response = send_from_directory(
+        app.static_folder, path, mimetype=mimetypes.guess_type(filename)[0],
+        max_age=config.ASSET_MAX_AGE if current else None)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    if filename.endswith(COMPRESSED_EXTENSIONS):
+        response.vary.add("Accept-Encoding")
+    if current:
+        response.cache_control.immutable = True
+    return response
+
+
+def metrics_page():
+    """
+    Renders the metrics of the current process in the Prometheus text
+    format.
+
+    Returns:
+    Response: plain text metrics
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+if config.METRICS:
+    app.add_url_rule("/metrics", "metrics", metrics_page)
+
+
 @app.route("/search", methods=["GET", "POST"])
+@csrf.exempt
 def search():
     """
-    Renders the search page.
+    Renders a page of the search results.
+    The ETag is derived from the generation of the search index and the
+    versions of the assets and templates, so pages are answered with 304
+    until entries are indexed or removed or the blog is updated.
+    Searches sent with POST are redirected to their linkable url.
 
     Returns:
     str: html formatted search page.
     """
-    form = SearchForm()
     if request.method == "POST":
-        query_str = request.form["query_str"]
-        query_res = ft_search(query_str)
-        return render_template("search.html", form=form, results=query_res), 200
-    return render_template("search.html", form=form, content=""), 200
+        query_str = request.form.get("q", request.form.get("query_str", ""))
+        return redirect(url_for("search", q=query_str), 303)
+    form = SearchForm(request.args)
+    query_str = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    if page < 1:
+        abort(404)
+    etag = hashlib.sha1(repr((
+        get_index_generation(), request.full_path, config.STYLE,
+        current_user.get_id(), ASSET_VERSION,
+        TEMPLATE_VERSION)).encode()).hexdigest()
+    if is_resource_modified(request.environ, etag=etag):
+        results, more = ft_search(query_str, page) if query_str != "" \
+            else ([], False)
+        response = make_response(render_template(
+            "search.html", form=form, results=results, query=query_str,
+            page=page, more=more))
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    response.cache_control.max_age = config.SEARCH_MAX_AGE
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.vary.add("Cookie")
+    return response
+
+
+@app.route("/search/suggest")
+def suggest():
+    """
+    Returns items whose name or year starts with the typed text.
+
+    Returns:
+    Response: json formatted list of the suggested items
+    """
+    items = suggestions.suggest(request.args.get("q", ""),
+                                config.SUGGEST_NUMBER)
+    response = jsonify([dict(id=item.id, name=item.name, date=item.date,
+                             url=url_for("item", ident=item.id))
+                        for item in items])
+    response.cache_control.public = True
+    response.cache_control.max_age = config.SUGGEST_MAX_AGE
+    return response
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -177,10 +564,18 @@ def login():
         return redirect(url_for("index"))
     form = LoginForm()
     if form.validate_on_submit():
+        if not auth_limiter.allow(("ip", request.remote_addr),
+                                  ("user", form.username.data)):
+            flash("Too many attempts, please try again later.")
+            return render_template("login.html", form=form), 429
         user = db.get_user_by_name(form.username.data)
-        print(user)
         if user is not None:
-            if user.check_password(form.password.data):
+            done, valid = hash_executor.run(user.check_password,
+                                            form.password.data)
+            if not done:
+                flash("Too many attempts, please try again later.")
+                return render_template("login.html", form=form), 503
+            if valid:
                 login_user(user)
                 return redirect(url_for("index"))
         flash("Invalid username or password.")
@@ -213,9 +608,17 @@ def register():
         return redirect(url_for("index"))
     form = RegisterForm()
     if form.validate_on_submit():
+        if not auth_limiter.allow(("ip", request.remote_addr),
+                                  ("user", form.username.data)):
+            flash("Too many attempts, please try again later.")
+            return render_template("register.html", form=form), 429
         user = db.get_user_by_name(form.username.data)
         if user is None:
-            ident = db.insert_user(form.username.data, form.password.data)
+            done, ident = hash_executor.run(db.insert_user, form.username.data,
+                                            form.password.data)
+            if not done:
+                flash("Too many attempts, please try again later.")
+                return render_template("register.html", form=form), 503
             if ident is not None:
                 user = db.get_user_by_id(ident)
                 login_user(user)
@@ -239,9 +642,13 @@ def write_entry():
         return redirect(url_for("index"))
     form = WriteForm()
     if form.validate_on_submit():
-        db.insert_entry(form.name.data, form.date.data,
-                        form.text.data, form.rating.data, current_user.id)
-        create_search_index()
+        ident = db.insert_entry(form.name.data, form.date.data,
+                                form.text.data, form.rating.data,
+                                current_user.id)
+        job_queue.notify()
+        entry = db.get_entry_by_id(ident)
+        if entry is not None:
+            suggestions.add(entry.item)
         return redirect(url_for("index"))
     return render_template("write.html", form=form)
 
@@ -259,9 +666,10 @@ def delete_entry(ident):
         return redirect(url_for("index"))
     if current_user.id == db.get_entry_by_id(ident).user.id:
         db.delete_entry(ident)
-        create_search_index()
+        job_queue.notify()
     return redirect(url_for("index"))
 
 
 if __name__ == "__main__":
+    job_queue.start()
     app.run(host="0.0.0.0")
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import os
+from werkzeug.security import safe_join
+
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSED_EXTENSIONS = (".css", ".js", ".svg", ".txt", ".xml", ".json")
+
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def asset_version(directory):
+    """
+    Return a hash over the contents of all static files.
+    It is part of the urls of the assets, so they change whenever any asset
+    changes, which also covers stylesheets importing each other by relative
+    urls.
+
+    Parameters:
+    directory (PathLike): directory of the static files
+
+    Returns:
+    str: version of the static files
+    """
+    digest = hashlib.sha256()
+    for path in sorted(static_files(directory)):
+        digest.update(os.path.relpath(path, directory).encode() + b"\0")
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+def static_files(directory):
+    """
+    Return the paths of all static files without their compressed copies.
+
+    Parameters:
+    directory (PathLike): directory of the static files
+
+    Returns:
+    List(PathLike): paths of the static files
+    """
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(tuple(ext for _, ext in ENCODINGS)):
+                paths.append(os.path.join(root, name))
+    return paths
+
+
+def compress_assets(directory):
+    """
+    Store gzip and, if the brotli package is installed, brotli compressed
+    copies next to the text assets that are missing or outdated.
+    A read-only static directory is left as it is and its assets are served
+    uncompressed.
+
+    Parameters:
+    directory (PathLike): directory of the static files
+    """
+    for path in static_files(directory):
+        if not path.endswith(COMPRESSED_EXTENSIONS):
+            continue
+        with open(path, "rb") as file:
+            data = file.read()
+        for encoding, ext in ENCODINGS:
+            if encoding == "br" and brotli is None:
+                continue
+            target = path + ext
+            if os.path.exists(target) and \
+                    os.path.getmtime(target) >= os.path.getmtime(path):
+                continue
+            if encoding == "br":
+                compressed = brotli.compress(data)
+            else:
+                compressed = gzip.compress(data, 9, mtime=0)
+            tmp_path = target + "." + str(os.getpid())
+            try:
+                with open(tmp_path, "wb") as file:
+                    file.write(compressed)
+                os.replace(tmp_path, target)
+            except OSError:
+                return
+
+
+def compressed_asset(directory, filename, accept_encodings):
+    """
+    Return the best precompressed copy of an asset the client accepts.
+
+    Parameters:
+    directory (PathLike): directory of the static files
+    filename (str): path of the asset relative to the directory
+    accept_encodings (Accept): encodings accepted by the client
+
+    Returns:
+    tuple: encoding and file name of the copy, None and the original file
+        name if there is none
+    """
+    for encoding, ext in ENCODINGS:
+        path = safe_join(directory, filename + ext)
+        if accept_encodings[encoding] and path is not None and \
+                os.path.isfile(path):
+            return encoding, filename + ext
+    return None, filename
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a rendered page with gzip if the client accepts it and the page
+    is large enough for compression to pay off.
+    The ETag becomes weak as the compressed body differs from the
+    uncompressed one, conditional requests still match it.
+
+    Parameters:
+    response (Response): response to compress
+    accept_encodings (Accept): encodings accepted by the client
+
+    Returns:
+    Response: the response, compressed if it was worth it
+    """
+    if response.direct_passthrough or \
+            response.mimetype not in config.COMPRESS_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.status_code != 200 or \
+            "Content-Encoding" in response.headers or \
+            not accept_encodings["gzip"]:
+        return response
+    data = response.get_data()
+    if len(data) < config.COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, config.COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,204 @@
+import argparse
+from datetime import date, timedelta
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = ["game", "story", "music", "level", "boss", "combat", "world",
+         "graphics", "puzzle", "quest", "hero", "dungeon", "sound", "town",
+         "map", "sword", "magic", "speed", "race", "jump", "score", "time",
+         "ending", "secret", "controls", "camera", "light", "dark", "great",
+         "boring", "short", "long", "classic", "sequel", "remake", "retro"]
+
+
+def generate_data(db, number, seed=0):
+    """
+    Fill an empty database with deterministic synthetic reviews.
+
+    Parameters:
+    db (Database): database to fill
+    number (int): number of entries to create
+    seed (int): seed of the random generator
+
+    Returns:
+    List(str): names of the created users
+    """
+    rnd = random.Random(seed)
+    users = ["user" + str(i) for i in range(max(10, number // 100))]
+    items = [(rnd.choice(WORDS).title() + " " + rnd.choice(WORDS).title() +
+              " " + str(i), str(rnd.randint(1980, 2022)))
+             for i in range(max(10, number // 3))]
+    from content import html_to_text
+    start = date(2010, 1, 1)
+    conn = db.connect()
+    crs = conn.cursor()
+    crs.executemany("INSERT INTO " + db.USER_TABLE_FILE +
+                    "(`name`, `password`) VALUES (?, ?)",
+                    [(name, "x") for name in users])
+    crs.executemany("INSERT INTO " + db.ITEM_TABLE_FILE +
+                    "(`name`, `date`) VALUES (?, ?)", items)
+    entries = []
+    for i in range(number):
+        paragraphs = ["<p>" + " ".join(rnd.choice(WORDS) for _ in
+                                       range(rnd.randint(20, 80))) + "</p>"
+                      for _ in range(rnd.randint(1, 4))]
+        entries.append((rnd.randint(1, len(items)), "".join(paragraphs),
+                        html_to_text("".join(paragraphs)),
+                        rnd.randint(0, 100), rnd.randint(1, len(users)),
+                        (start + timedelta(days=i * 4000 // number))
+                        .strftime("%Y-%m-%d")))
+    crs.executemany("INSERT INTO " + db.ENTRY_TABLE_FILE +
+                    "(`item_id`, `text`, `plain`, `rating`, `user_id`, " +
+                    "`date`) VALUES (?, ?, ?, ?, ?, ?)", entries)
+    db.fill_item_stats(crs)
+    conn.commit()
+    return users
+
+
+def measure(func, repeat):
+    """
+    Measure the run time of a function.
+
+    Parameters:
+    func (function): function to measure
+    repeat (int): number of runs
+
+    Returns:
+    dict: minimum and median run time in seconds and the number of runs
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return dict(min=min(times), median=statistics.median(times),
+                repeat=repeat)
+
+
+def run_size(number, repeat):
+    """
+    Run all benchmarks on a database of a given size in the current working
+    directory.
+
+    Parameters:
+    number (int): number of entries to create
+    repeat (int): number of runs of every benchmark
+
+    Returns:
+    dict: results of the benchmarks by their names
+    """
+    os.makedirs("data", exist_ok=True)
+    import config
+    config.PAGE_CACHE = None
+    config.SEARCH_CACHE_SIZE = 0
+    from database import Database
+    db = Database()
+    users = generate_data(db, number)
+    from app import app
+    from content import rating_to_star
+    from jobs import job_queue
+    from search import create_search_index, ft_search_times
+    client = app.test_client()
+    # the migrations of a new database enqueue a rebuild of the search index,
+    # it runs before measuring, so no job competes with the benchmarks
+    if job_queue.run_pending() == 0:
+        create_search_index()
+
+    def render(url):
+        response = client.get(url)
+        assert response.status_code == 200, url
+
+    benchmarks = {
+        "get_entries": db.get_entries,
+        "get_entries_by_username":
+            lambda: db.get_entries_by_username(users[0]),
+        "create_search_index": create_search_index,
+        "ft_search_times": lambda: ft_search_times("great game", 10),
+        "rating_to_star": lambda: [rating_to_star(r) for r in range(101)],
+        "render_index": lambda: render("/"),
+        "render_archive": lambda: render("/archive"),
+        "render_feed": lambda: render("/feed"),
+    }
+    return {name: measure(func, repeat) for name, func in benchmarks.items()}
+
+
+def git_commit():
+    """
+    Return the commit the benchmarks run on.
+
+    Returns:
+    str: hash of the commit, None if it can't be determined
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Print the change of the median run times relative to a baseline.
+
+    Parameters:
+    results (dict): results of the current run
+    baseline (dict): results of an earlier run
+    """
+    for size, benchmarks in results["sizes"].items():
+        for name, result in benchmarks.items():
+            old = baseline["sizes"].get(size, {}).get(name)
+            if old is None:
+                continue
+            ratio = result["median"] / old["median"]
+            print(size.rjust(7) + " " + name.ljust(24) +
+                  "{0:10.4f}s {1:7.2f}x".format(result["median"], ratio))
+
+
+def main():
+    """
+    Run the benchmarks for all requested sizes, each in its own process and
+    working directory, and store the results as json.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the database, search and page rendering.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated numbers of entries")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs of every benchmark")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="file to store the results in")
+    parser.add_argument("--compare", help="results of an earlier run")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_size is not None:
+        json.dump(run_size(args.run_size, args.repeat), sys.stdout)
+        return
+    results = dict(commit=git_commit(), python=platform.python_version(),
+                   time=time.strftime("%Y-%m-%dT%H:%M:%S"), sizes={})
+    script = os.path.abspath(__file__)
+    for size in args.sizes.split(","):
+        with tempfile.TemporaryDirectory() as workdir:
+            output = subprocess.check_output(
+                [sys.executable, script, "--run-size", size, "--repeat",
+                 str(args.repeat)], cwd=workdir,
+                env=dict(os.environ, PYTHONPATH=os.path.dirname(script)))
+        results["sizes"][size] = json.loads(output.decode().splitlines()[-1])
+        for name, result in results["sizes"][size].items():
+            print(size.rjust(7) + " " + name.ljust(24) +
+                  "{0:10.4f}s".format(result["median"]))
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
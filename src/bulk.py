@@ -0,0 +1,168 @@
+import argparse
+import csv
+import json
+import sys
+
+from database import Database
+
+FIELDS = ["name", "date", "text", "rating", "user", "written"]
+
+
+def file_format(path, name=None):
+    """
+    Return the format of a file of entries.
+
+    Parameters:
+    path (PathLike): path of the file, - for stdin or stdout
+    name (str): format requested by the user, None to guess it by extension
+
+    Returns:
+    str: jsonl or csv
+    """
+    if name is not None:
+        return name
+    if str(path).lower().endswith(".csv"):
+        return "csv"
+    return "jsonl"
+
+
+def optional_str(value):
+    """
+    Convert an optional field of an entry to a string.
+
+    Parameters:
+    value (object): value of the field
+
+    Returns:
+    str: the value as string, None if it is missing or empty
+    """
+    if value is None or str(value) == "":
+        return None
+    return str(value)
+
+
+def read_rows(file, fmt):
+    """
+    Read entries from a file one after another.
+    Values are read as strings, so items are matched by name and date no
+    matter if a date was written as number, and every item needs a date like
+    items created by the form.
+
+    Parameters:
+    file (TextIO): opened file to read from
+    fmt (str): jsonl or csv
+
+    Returns:
+    Iterator(tuple): item name, item date, text, rating, user name and date of
+        every entry
+    """
+    if fmt == "csv":
+        records = csv.DictReader(file)
+    else:
+        records = (json.loads(line) for line in file if line.strip() != "")
+    for number, record in enumerate(records, 1):
+        try:
+            date = str(record["date"]).strip()
+            if date == "":
+                raise ValueError("date of the item is missing")
+            yield (str(record["name"]), date, str(record["text"]),
+                   int(record["rating"]), optional_str(record.get("user")),
+                   optional_str(record.get("written")))
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError("Invalid entry " + str(number) + ": " +
+                             repr(error)) from error
+
+
+def write_rows(file, fmt, rows):
+    """
+    Write entries to a file one after another.
+
+    Parameters:
+    file (TextIO): opened file to write to
+    fmt (str): jsonl or csv
+    rows (Iterable(tuple)): item name, item date, text, rating, user name and
+        date of every entry
+
+    Returns:
+    int: number of written entries
+    """
+    count = 0
+    writer = csv.writer(file) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(FIELDS)
+    for row in rows:
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            file.write(json.dumps(dict(zip(FIELDS, row))) + "\n")
+        count += 1
+    return count
+
+
+def import_entries(path, fmt=None):
+    """
+    Import entries from a file in a single transaction and rebuild the search
+    index once afterwards.
+
+    Parameters:
+    path (PathLike): path of the file, - for stdin
+    fmt (str): jsonl or csv, None to guess it by extension
+
+    Returns:
+    int: number of imported entries
+    """
+    fmt = file_format(path, fmt)
+    db = Database()
+    if path == "-":
+        count = db.insert_entries(read_rows(sys.stdin, fmt))
+    else:
+        with open(path, newline="", encoding="utf-8") as file:
+            count = db.insert_entries(read_rows(file, fmt))
+    from search import create_search_index
+    create_search_index()
+    return count
+
+
+def export_entries(path, fmt=None):
+    """
+    Export all entries to a file.
+
+    Parameters:
+    path (PathLike): path of the file, - for stdout
+    fmt (str): jsonl or csv, None to guess it by extension
+
+    Returns:
+    int: number of exported entries
+    """
+    fmt = file_format(path, fmt)
+    rows = Database().iter_entry_rows()
+    if path == "-":
+        return write_rows(sys.stdout, fmt, rows)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        return write_rows(file, fmt, rows)
+
+
+def main():
+    """
+    Import or export entries as JSON Lines or CSV.
+    """
+    parser = argparse.ArgumentParser(
+        description="Import or export entries as JSON Lines or CSV with the " +
+        "fields " + ", ".join(FIELDS) + ".")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="file to read or write, - for stdin or " +
+                        "stdout")
+    parser.add_argument("--format", choices=["jsonl", "csv"],
+                        help="format of the file, guessed by the extension " +
+                        "by default")
+    args = parser.parse_args()
+    if args.command == "import":
+        count = import_entries(args.path, args.format)
+        print("Imported " + str(count) + " entries.", file=sys.stderr)
+    else:
+        count = export_entries(args.path, args.format)
+        print("Exported " + str(count) + " entries.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import config
+
+
+class LRUCache():
+    """
+    A class to represent a cache in the memory of the process that evicts the
+    least recently used values.
+
+    Attributes:
+    size (int): maximum number of values to store
+    values (OrderedDict): stored values ordered by their last usage
+    lock (Lock): lock that guards the stored values
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return a stored value.
+
+        Parameters:
+        key (tuple): key of the value
+
+        Returns:
+        object: stored value, None if there is none
+        """
+        with self.lock:
+            value = self.values.get(key)
+            if value is not None:
+                self.values.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value and evict the least recently used ones if needed.
+
+        Parameters:
+        key (tuple): key of the value
+        value (object): value to store
+        """
+        with self.lock:
+            self.values[key] = value
+            self.values.move_to_end(key)
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove a stored value.
+
+        Parameters:
+        key (tuple): key of the value
+        """
+        with self.lock:
+            self.values.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all stored values.
+        """
+        with self.lock:
+            self.values.clear()
+
+
+class TTLCache(LRUCache):
+    """
+    A class to represent a cache in the memory of the process that evicts the
+    least recently used values and values older than a given time.
+
+    Attributes:
+    ttl (float): seconds a value is kept
+    """
+
+    def __init__(self, size, ttl):
+        super().__init__(size)
+        self.ttl = ttl
+
+    def get(self, key):
+        """
+        Return a stored value that didn't expire yet.
+
+        Parameters:
+        key (tuple): key of the value
+
+        Returns:
+        object: stored value, None if there is none
+        """
+        stored = super().get(key)
+        if stored is None:
+            return None
+        expires, value = stored
+        if expires < time.monotonic():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value):
+        """
+        Store a value that expires after the ttl.
+
+        Parameters:
+        key (tuple): key of the value
+        value (object): value to store
+        """
+        super().set(key, (time.monotonic() + self.ttl, value))
+
+
+class DiskCache():
+    """
+    A class to represent a cache in a directory that can be shared by
+    multiple processes.
+    The first element of every key is the generation of the content, values
+    of older generations are removed once a newer one is stored.
+
+    Attributes:
+    directory (PathLike): path of the directory that stores the values
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        """
+        Return the path of the file that stores a value.
+
+        Parameters:
+        key (tuple): key of the value
+
+        Returns:
+        PathLike: path of the file
+        """
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, str(key[0]), name)
+
+    def get(self, key):
+        """
+        Return a stored value.
+
+        Parameters:
+        key (tuple): key of the value
+
+        Returns:
+        object: stored value, None if there is none
+        """
+        try:
+            with open(self.path(key), "rb") as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        """
+        Store a value and remove the values of older generations.
+
+        Parameters:
+        key (tuple): key of the value
+        value (object): value to store
+        """
+        path = self.path(key)
+        generation_dir = os.path.dirname(path)
+        tmp_path = path + "." + str(os.getpid()) + "." + \
+            str(threading.get_ident())
+        try:
+            if not os.path.exists(generation_dir):
+                self.clear()
+                os.makedirs(generation_dir, exist_ok=True)
+            with open(tmp_path, "wb") as file:
+                pickle.dump(value, file)
+            os.replace(tmp_path, path)
+        except OSError:
+            # another process removed the generation concurrently
+            pass
+
+    def clear(self):
+        """
+        Remove all stored values.
+        """
+        if os.path.exists(self.directory):
+            for name in os.listdir(self.directory):
+                shutil.rmtree(os.path.join(self.directory, name),
+                              ignore_errors=True)
+
+
+def create_page_cache():
+    """
+    Create the cache for rendered pages that is set in the config.
+
+    Returns:
+    LRUCache: cache for rendered pages, None if caching is disabled
+    """
+    if config.PAGE_CACHE == "memory":
+        return LRUCache(config.PAGE_CACHE_SIZE)
+    if config.PAGE_CACHE == "disk":
+        return DiskCache(config.PAGE_CACHE_DIR)
+    return None
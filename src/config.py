@@ -10,11 +10,131 @@ WEBSITE = "localhost:5000"
 # Theme for the blog: dark, light
 STYLE = "dark"
 
+# File storing the secret key shared by all processes of the server
+SECRET_KEY_FILE = "data/secret_key"
+
+# Address the production server listens on
+BIND = "0.0.0.0:5000"
+
+# Number of processes of the production server
+WORKERS = 4
+
+# Number of threads per process of the production server
+THREADS = 4
+
 # Allow new registrations
 ALLOW_REGISTRATION = True
 
-# Location of the search-indexing directory
+# Number of entries to show per page
+PAGE_SIZE = 10
+
+# Number of entries to show in the RSS feed
+FEED_NUMBER = 20
+
+# Number of items to show on the top rated page
+TOP_NUMBER = 20
+
+# Cache for rendered pages: memory, disk (shared by all processes), None
+PAGE_CACHE = "memory"
+
+# Maximum number of pages in the memory cache
+PAGE_CACHE_SIZE = 256
+
+# Location of the page cache directory of the disk cache
+PAGE_CACHE_DIR = "cache"
+
+# Search backend: whoosh, fts5 (full-text search table in the database)
+SEARCH_BACKEND = "whoosh"
+
+# Location of the static export of the blog created by export.py
+EXPORT_DIR = "export"
+
+# Location of the search-indexing directory of the whoosh backend
 INDEX_DIR = "indexdir"
 
+# Megabytes of memory the whoosh backend uses while rebuilding the index
+INDEX_MEMORY = 256
+
 # Number of search results to show
 SEARCH_NUMBER = 10
+
+# Seconds browsers and proxies may reuse a search page without asking again
+SEARCH_MAX_AGE = 60
+
+# Number of items suggested while typing a search
+SUGGEST_NUMBER = 8
+
+# Seconds after which the suggestions of a process are loaded again to pick up
+# items created by other processes
+SUGGEST_REFRESH = 60
+
+# Seconds browsers and proxies may reuse suggestions without asking again
+SUGGEST_MAX_AGE = 60
+
+# Maximum number of searches whose results are cached by every process, 0 to
+# disable the cache
+SEARCH_CACHE_SIZE = 512
+
+# Seconds cached search results are used before searching again
+SEARCH_CACHE_TTL = 600
+
+# Seconds to wait for a locked database before failing
+DB_TIMEOUT = 5
+
+# Size of the database page cache in KiB
+DB_CACHE_SIZE = 8192
+
+# Size of the memory mapped database io in bytes, 0 to disable it
+DB_MMAP_SIZE = 134217728
+
+# Maximum number of users kept in the memory of every process
+USER_CACHE_SIZE = 1024
+
+# Seconds a cached user is used before it is loaded again
+USER_CACHE_TTL = 300
+
+# Number of reverse proxies in front of the server whose X-Forwarded-For and
+# X-Forwarded-Proto headers are trusted, 0 if clients connect directly,
+# attempts are limited by the client address taken from them
+PROXY_COUNT = 0
+
+# Login and registration attempts a client or user name gains per second
+AUTH_RATE = 0.1
+
+# Login and registration attempts a client or user name can make at once
+AUTH_BURST = 5
+
+# Number of threads of every process that hash and check passwords, together
+# with HASH_QUEUE it is capped below THREADS, so hashing always leaves a
+# request thread free for reading
+HASH_WORKERS = 2
+
+# Number of password hashes of every process that may wait for a thread
+HASH_QUEUE = 1
+
+# Number of attempts of a failing background job
+JOB_ATTEMPTS = 5
+
+# Seconds the background worker waits between looking for jobs
+JOB_POLL_INTERVAL = 5
+
+# Serve Prometheus metrics on /metrics, every process of the production server
+# keeps its own metrics and a scrape returns those of the process that
+# answered, so counters are only consistent with WORKERS = 1
+METRICS = False
+
+# Seconds browsers may cache the static files referenced by versioned urls
+ASSET_MAX_AGE = 31536000
+
+# Content types of pages that are compressed with gzip
+COMPRESS_MIMETYPES = ["text/html", "application/rss+xml", "application/xml",
+                      "text/xml"]
+
+# Minimum size in bytes of a page to compress it
+COMPRESS_MIN_SIZE = 1024
+
+# Level of the gzip compression of pages, 1 is fastest and 9 is smallest
+COMPRESS_LEVEL = 6
+
+# Seconds after which requests are logged with their queries, None to disable
+SLOW_REQUEST_TIME = 1
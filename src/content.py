@@ -1,6 +1,61 @@
-from database import Database
+from html.parser import HTMLParser
 
-db = Database()
+BLOCK_TAGS = {"address", "article", "aside", "blockquote", "br", "dd", "div",
+              "dl", "dt", "figcaption", "figure", "footer", "h1", "h2", "h3",
+              "h4", "h5", "h6", "header", "hr", "li", "ol", "p", "pre",
+              "section", "table", "td", "th", "tr", "ul"}
+
+SKIPPED_TAGS = {"script", "style", "template"}
+
+
+class TextExtractor(HTMLParser):
+    """
+    A class to collect the text of an html document.
+    Block elements separate words, the contents of scripts and styles are
+    left out.
+
+    Attributes:
+    parts (List(str)): collected pieces of text
+    skipping (int): depth of the skipped elements the parser is in
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if self.skipping == 0:
+            self.parts.append(data)
+
+
+def html_to_text(text):
+    """
+    Convert a text from html formatted to unformatted with normalized
+    whitespace.
+
+    Parameters:
+    text (str): html formatted text
+
+    Returns:
+    str: text without html tags and entities
+    """
+    parser = TextExtractor()
+    parser.feed(text)
+    parser.close()
+    return " ".join("".join(parser.parts).split())
 
 
 def rating_to_star(rating):
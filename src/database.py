@@ -1,8 +1,15 @@
 from datetime import date as dt
 import os
 import sqlite3
+import threading
+import time
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from cache import TTLCache
+import config
+from content import html_to_text
+import metrics
+
 
 class User():
     """
@@ -14,9 +21,12 @@ class User():
     is_active (bool): check if the user is active
     is_authenticated (bool): check if the user is logged in
     is_anonymous (bool): check if the user is is_anonymous
-    pass_hash (str): hash of the users password
+    pass_hash (str): hash of the users password, None if it wasn't loaded
     """
 
+    __slots__ = ("name", "id", "is_active", "is_authenticated",
+                 "is_anonymous", "pass_hash")
+
     def __init__(self, name, pass_hash=None):
         self.name = name
         self.id = None
@@ -80,12 +90,49 @@ class Item():
     name (str): name of the item
     id (int): id of the item
     date (str): date the item was created
+    count (int): number of entries rating the item
+    total (int): sum of the ratings of the item
+    minimum (int): lowest rating of the item, None if there is none
+    maximum (int): highest rating of the item, None if there is none
     """
 
+    __slots__ = ("name", "date", "id", "count", "total", "minimum", "maximum")
+
     def __init__(self, name, date):
         self.name = name
         self.date = date
         self.id = None
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    @property
+    def average(self):
+        """
+        Return the average rating of the item.
+
+        Returns:
+        float: average rating, None if the item wasn't rated
+        """
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def set_stats(self, count, total, minimum, maximum):
+        """
+        Set the aggregated ratings of the item.
+
+        Parameters:
+        count (int): number of entries rating the item, None if there are none
+        total (int): sum of the ratings of the item
+        minimum (int): lowest rating of the item
+        maximum (int): highest rating of the item
+        """
+        self.count = count or 0
+        self.total = total or 0
+        self.minimum = minimum
+        self.maximum = maximum
 
     def set_id(self, ident):
         """
@@ -102,20 +149,53 @@ class Entry():
     A class to represent an entry.
 
     Attributes:
-    text (str): text of the entry
+    text (str): text of the entry, loaded on first access if it wasn't
+        selected with the entry
     rating (int): rating of the item
     date (str): date the entry was created
     item (Item): item that is referenced by the entry
     user (User): user that authored the entry
     id (int): id of the item
+    plain (str): text of the entry without html, None if it wasn't selected
+    snippet (str): html formatted excerpt of the text matching a search
+    loader (function): function that loads the text by the id of the entry
     """
 
-    def __init__(self, text, rating, date):
-        self.text = text
+    __slots__ = ("stored_text", "rating", "date", "item", "user", "id",
+                 "plain", "snippet", "loader")
+
+    def __init__(self, text, rating, date, loader=None):
+        self.stored_text = text
         self.rating = rating
         self.date = date
         self.item = None
         self.user = None
+        self.id = None
+        self.plain = None
+        self.snippet = None
+        self.loader = loader
+
+    @property
+    def text(self):
+        """
+        Return the text of the entry and load it if it wasn't yet.
+
+        Returns:
+        str: text of the entry
+        """
+        if self.stored_text is None and self.loader is not None:
+            self.stored_text = self.loader(self.id)
+        return self.stored_text
+
+    @text.setter
+    def text(self, text):
+        """
+        Set the text of the entry.
+
+        Parameters:
+        text(str): text of the entry
+        """
+        self.stored_text = text
 
     def set_id(self, ident):
         """
@@ -144,6 +224,179 @@ class Entry():
         """
         self.user = user
 
+    def set_plain(self, plain):
+        """
+        Set the text of the entry without html.
+
+        Parameters:
+        plain(str): text of the entry without html
+        """
+        self.plain = plain
+
+    def set_snippet(self, snippet):
+        """
+        Set the search snippet of the entry.
+
+        Parameters:
+        snippet(str): html formatted excerpt of the text matching a search
+        """
+        self.snippet = snippet
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    A class to represent a cursor that records its queries and their run time
+    in the metrics of the current request.
+    """
+
+    def execute(self, query, params=()):
+        """
+        Execute a query and record it.
+
+        Parameters:
+        query (str): query to execute
+        params (tuple): parameters of the query
+
+        Returns:
+        Cursor: the cursor itself
+        """
+        start = time.perf_counter()
+        try:
+            return super().execute(query, params)
+        finally:
+            metrics.record_query(query, time.perf_counter() - start)
+
+    def executemany(self, query, params):
+        """
+        Execute a query for every set of parameters and record it.
+
+        Parameters:
+        query (str): query to execute
+        params (iterable): parameters of the queries
+
+        Returns:
+        Cursor: the cursor itself
+        """
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, params)
+        finally:
+            metrics.record_query(query, time.perf_counter() - start)
+
+    def fetchone(self):
+        """
+        Fetch the next row and record the time spent.
+
+        Returns:
+        tuple: next row, None if there is none
+        """
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            metrics.record_fetch(time.perf_counter() - start)
+
+    def fetchall(self):
+        """
+        Fetch all remaining rows and record the time spent.
+
+        Returns:
+        List(tuple): remaining rows
+        """
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            metrics.record_fetch(time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    A class to represent a connection whose cursors record their queries.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        """
+        Return a new cursor of the connection.
+
+        Parameters:
+        factory (type): class of the cursor
+
+        Returns:
+        Cursor: new cursor
+        """
+        return super().cursor(factory)
+
+    def execute(self, query, params=()):
+        """
+        Execute a query with a new cursor.
+
+        Parameters:
+        query (str): query to execute
+        params (tuple): parameters of the query
+
+        Returns:
+        Cursor: cursor that executed the query
+        """
+        return self.cursor().execute(query, params)
+
+
+class ConnectionManager():
+    """
+    A class to manage the connections to a database file.
+    Every thread gets its own connection that is reused until it is closed.
+
+    Attributes:
+    path (PathLike): path of the database file
+    local (local): thread local storage holding the connection of a thread
+    migrated (bool): check if the schema of the database was upgraded
+    users (TTLCache): recently loaded users by their ids and names
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.migrated = False
+        self.users = TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
+    def open(self):
+        """
+        Open a new connection and tune it for concurrent reads.
+
+        Returns:
+        Connection: connection to the database
+        """
+        db = sqlite3.connect(self.path, timeout=config.DB_TIMEOUT,
+                             factory=TimedConnection)
+        metrics.record_connection()
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.execute("PRAGMA cache_size = " + str(-int(config.DB_CACHE_SIZE)))
+        db.execute("PRAGMA mmap_size = " + str(int(config.DB_MMAP_SIZE)))
+        return db
+
+    def get(self):
+        """
+        Return the connection of the current thread, open it if there is none.
+
+        Returns:
+        Connection: connection to the database
+        """
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.open()
+            self.local.db = db
+        return db
+
+    def close(self):
+        """
+        Close the connection of the current thread if there is one.
+        """
+        db = getattr(self.local, "db", None)
+        if db is not None:
+            self.local.db = None
+            db.close()
+
 
 class Database:
     """
@@ -153,53 +406,330 @@ class Database:
     USER_TABLE_FILE (str): name of the user table
     ENTRY_TABLE_FILE (str): name of the entry table
     ITEM_TABLE_FILE (str): name of the item table
+    META_TABLE_FILE (str): name of the table storing counters of the content
+    JOB_TABLE_FILE (str): name of the table storing pending background jobs
+    ITEM_STATS_TABLE_FILE (str): name of the table storing the aggregated
+        ratings of the items
     DB_DIR(PathLike): path that leads to the directory containing the database
+    RECENT_ORDER (List(tuple)): order of entries with the newest first
+    ARCHIVE_ORDER (List(tuple)): order of entries grouped by items and years
+    ITEM_ORDER (List(tuple)): order of the entries of an item with the best
+        first
+    TOP_ORDER (str): order of the aggregated ratings with the best average
+        first
+    managers (dict): connection managers shared by all instances by path
     """
 
+    RECENT_ORDER = [("e.id", True)]
+    ARCHIVE_ORDER = [("i.date", True), ("i.name", False), ("e.id", False)]
+    ITEM_ORDER = [("e.rating", True), ("e.id", True)]
+    TOP_ORDER = "total * 1.0 / count DESC, count DESC"
+
+    managers = {}
+    managers_lock = threading.Lock()
+
     def __init__(self):
         self.USER_TABLE_FILE = 'USERS'
         self.ENTRY_TABLE_FILE = 'ENTRIES'
         self.ITEM_TABLE_FILE = 'ITEMS'
+        self.META_TABLE_FILE = 'META'
+        self.JOB_TABLE_FILE = 'JOBS'
+        self.ITEM_STATS_TABLE_FILE = 'ITEM_STATS'
         self.DB_DIR = os.path.dirname("./data/")
+        path = os.path.join(self.DB_DIR, "data.db")
+        with Database.managers_lock:
+            if path not in Database.managers:
+                Database.managers[path] = ConnectionManager(path)
+            self.manager = Database.managers[path]
         self.setup_db()
 
     def connect(self):
         """
         Connect to an existing database instance based on the object
         attributes.
+        The connection is reused by the current thread until close is called.
 
         Return:
         Connection: connection to the database
         """
-        path = os.path.join(self.DB_DIR, "data.db")
-        return sqlite3.connect(path)
+        return self.manager.get()
+
+    def close(self):
+        """
+        Close the connection of the current thread.
+        """
+        self.manager.close()
 
     def setup_db(self):
         """
-        Creates a database with the needed tables if it doesn't already exits.
+        Creates a database with the needed tables if it doesn't already exits
+        and upgrades it to the newest schema.
+        This only happens once per process for every database file.
+        """
+        with Database.managers_lock:
+            if self.manager.migrated:
+                return
+            self.migrate()
+            self.manager.migrated = True
+
+    def migrations(self):
+        """
+        Return the steps to upgrade the schema of the database.
+        The schema version n is reached by applying the first n migrations.
+        A step is either a query or a function that is called with the cursor
+        of the migration.
+
+        Returns:
+        List(List): steps of all migrations
+        """
+        return [
+            [
+                "CREATE TABLE IF NOT EXISTS " + self.USER_TABLE_FILE +
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT," +
+                "name CHAR(32) NOT NULL UNIQUE," +
+                "password CHAR(32) NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS " + self.ITEM_TABLE_FILE +
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT," +
+                "name CHAR(32) NOT NULL," +
+                "date CHAR(4)," +
+                "UNIQUE(date, name))",
+                "CREATE TABLE IF NOT EXISTS " + self.ENTRY_TABLE_FILE +
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT," +
+                "item_id INTEGER NOT NULL REFERENCES " +
+                self.ITEM_TABLE_FILE + "(id)," +
+                "text TEXT NOT NULL," +
+                "rating INTEGER NOT NULL," +
+                "user_id INTEGER REFERENCES " + self.USER_TABLE_FILE +
+                "(id)," +
+                "date CHAR(10) NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS " + self.META_TABLE_FILE +
+                "(key CHAR(32) PRIMARY KEY," +
+                "value INTEGER NOT NULL)",
+            ],
+            [
+                "CREATE INDEX IF NOT EXISTS " + self.ENTRY_TABLE_FILE +
+                "_USER ON " + self.ENTRY_TABLE_FILE + "(user_id, item_id)",
+                "CREATE INDEX IF NOT EXISTS " + self.ENTRY_TABLE_FILE +
+                "_ITEM ON " + self.ENTRY_TABLE_FILE + "(item_id, rating)",
+                "CREATE INDEX IF NOT EXISTS " + self.ENTRY_TABLE_FILE +
+                "_DATE ON " + self.ENTRY_TABLE_FILE + "(date)",
+            ],
+            [
+                "CREATE INDEX IF NOT EXISTS " + self.ITEM_TABLE_FILE +
+                "_ARCHIVE ON " + self.ITEM_TABLE_FILE + "(date DESC, name)",
+            ],
+            [
+                "CREATE TABLE IF NOT EXISTS " + self.JOB_TABLE_FILE +
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT," +
+                "kind CHAR(32) NOT NULL," +
+                "payload INTEGER," +
+                "attempts INTEGER NOT NULL DEFAULT 0," +
+                "run_at REAL," +
+                "locked_until REAL," +
+                "error TEXT)",
+                "CREATE INDEX IF NOT EXISTS " + self.JOB_TABLE_FILE +
+                "_RUN_AT ON " + self.JOB_TABLE_FILE + "(run_at)",
+            ],
+            [
+                "CREATE TABLE IF NOT EXISTS " + self.ITEM_STATS_TABLE_FILE +
+                "(item_id INTEGER PRIMARY KEY REFERENCES " +
+                self.ITEM_TABLE_FILE + "(id)," +
+                "count INTEGER NOT NULL," +
+                "total INTEGER NOT NULL," +
+                "minimum INTEGER NOT NULL," +
+                "maximum INTEGER NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS " + self.ITEM_STATS_TABLE_FILE +
+                "_TOP ON " + self.ITEM_STATS_TABLE_FILE + "(" +
+                self.TOP_ORDER + ")",
+                self.fill_item_stats,
+            ],
+            [
+                "ALTER TABLE " + self.ENTRY_TABLE_FILE +
+                " ADD COLUMN plain TEXT NOT NULL DEFAULT ''",
+                self.fill_plain_texts,
+                lambda crs: self.enqueue_job("rebuild_index", None, crs),
+                lambda crs: self.increase_counter("generation", crs),
+            ],
+        ]
+
+    def migrate(self):
+        """
+        Apply all migrations newer than the schema version of the database.
+        The version is stored in the user_version pragma and every migration
+        runs in its own transaction, so an interrupted upgrade is resumed on
+        the next start.
         """
         db = self.connect()
         crs = db.cursor()
-        query = "CREATE TABLE IF NOT EXISTS " + self.USER_TABLE_FILE + \
-            "(id INTEGER PRIMARY KEY AUTOINCREMENT," + \
-            "name CHAR(32) NOT NULL UNIQUE," + \
-            "password CHAR(32) NOT NULL)"
-        crs.execute(query)
-        query = "CREATE TABLE IF NOT EXISTS " + self.ITEM_TABLE_FILE + \
-            "(id INTEGER PRIMARY KEY AUTOINCREMENT," + \
-            "name CHAR(32) NOT NULL," + \
-            "date CHAR(4)," + \
-            "UNIQUE(date, name))"
-        crs.execute(query)
-        query = "CREATE TABLE IF NOT EXISTS " + self.ENTRY_TABLE_FILE + \
-            "(id INTEGER PRIMARY KEY AUTOINCREMENT," + \
-            "item_id INTEGER NOT NULL REFERENCES " + self.ITEM_TABLE_FILE + "(id)," + \
-            "text TEXT NOT NULL," + \
-            "rating INTEGER NOT NULL," +\
-            "user_id INTEGER REFERENCES " + self.USER_TABLE_FILE + "(id),"\
-            "date CHAR(10) NOT NULL)"
+        for version, steps in enumerate(self.migrations(), 1):
+            crs.execute("BEGIN IMMEDIATE")
+            crs.execute("PRAGMA user_version")
+            if crs.fetchone()[0] >= version:
+                db.commit()
+                continue
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(crs)
+                    else:
+                        crs.execute(step)
+                crs.execute("PRAGMA user_version = " + str(version))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+    def fill_item_stats(self, crs):
+        """
+        Replace the aggregated ratings of all items by counting all entries.
+
+        Parameters:
+        crs (Cursor): cursor of the transaction to fill the table in
+        """
+        crs.execute("DELETE FROM " + self.ITEM_STATS_TABLE_FILE)
+        query = "INSERT INTO " + self.ITEM_STATS_TABLE_FILE + \
+            "(`item_id`, `count`, `total`, `minimum`, `maximum`) " + \
+            "SELECT item_id, COUNT(*), SUM(rating), MIN(rating), " + \
+            "MAX(rating) FROM " + self.ENTRY_TABLE_FILE + " GROUP BY item_id"
         crs.execute(query)
-        db.commit()
+
+    def fill_plain_texts(self, crs):
+        """
+        Store the text without html of all entries.
+
+        Parameters:
+        crs (Cursor): cursor of the transaction to fill the column in
+        """
+        crs.execute("SELECT id, text FROM " + self.ENTRY_TABLE_FILE)
+        rows = [(html_to_text(text), ident) for ident, text in crs.fetchall()]
+        query = "UPDATE " + self.ENTRY_TABLE_FILE + \
+            " SET plain = ? WHERE id = ?"
+        crs.executemany(query, rows)
+
+    def add_item_rating(self, item_id, rating, crs):
+        """
+        Add the rating of a new entry to the aggregated ratings of its item.
+
+        Parameters:
+        item_id (int): id of the rated item
+        rating (int): rating of the entry
+        crs (Cursor): cursor of the transaction the entry is inserted in
+        """
+        query = "INSERT INTO " + self.ITEM_STATS_TABLE_FILE + \
+            "(`item_id`, `count`, `total`, `minimum`, `maximum`)" + \
+            "VALUES (?, 1, ?, ?, ?) ON CONFLICT(item_id) DO UPDATE SET " + \
+            "count = count + 1, total = total + excluded.total, " + \
+            "minimum = MIN(minimum, excluded.minimum), " + \
+            "maximum = MAX(maximum, excluded.maximum)"
+        crs.execute(query, (item_id, rating, rating, rating))
+
+    def remove_item_rating(self, item_id, rating, crs):
+        """
+        Remove the rating of a deleted entry from the aggregated ratings of
+        its item.
+        The lowest and highest rating are looked up again in the index of the
+        entries of the item.
+
+        Parameters:
+        item_id (int): id of the rated item
+        rating (int): rating of the deleted entry
+        crs (Cursor): cursor of the transaction the entry is deleted in
+        """
+        query = "DELETE FROM " + self.ITEM_STATS_TABLE_FILE + \
+            " WHERE item_id = ? AND count <= 1"
+        crs.execute(query, (item_id, ))
+        ratings = "(SELECT {0}(rating) FROM " + self.ENTRY_TABLE_FILE + \
+            " WHERE item_id = ?)"
+        query = "UPDATE " + self.ITEM_STATS_TABLE_FILE + " SET " + \
+            "count = count - 1, total = total - ?, minimum = " + \
+            ratings.format("MIN") + ", maximum = " + ratings.format("MAX") + \
+            " WHERE item_id = ?"
+        crs.execute(query, (rating, item_id, item_id, item_id))
+
+    def get_counter(self, key):
+        """
+        Return a counter stored in the meta table.
+
+        Parameters:
+        key (str): name of the counter
+
+        Returns:
+        int: value of the counter, 0 if it was never increased
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = "SELECT value FROM " + self.META_TABLE_FILE + " WHERE key = ?"
+        crs.execute(query, (key, ))
+        fetched = crs.fetchone()
+        if fetched is None:
+            return 0
+        return fetched[0]
+
+    def increase_counter(self, key, crs=None):
+        """
+        Increase a counter stored in the meta table by one.
+
+        Parameters:
+        key (str): name of the counter
+        crs (Cursor): cursor of the transaction to increase the counter in,
+            None to increase it in its own transaction
+        """
+        db = self.connect()
+        commit = crs is None
+        if commit:
+            crs = db.cursor()
+        query = "INSERT INTO " + self.META_TABLE_FILE + "(`key`, `value`)" + \
+            "VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        crs.execute(query, (key, ))
+        if commit:
+            db.commit()
+
+    def set_counter(self, key, value, crs=None):
+        """
+        Set a counter stored in the meta table.
+
+        Parameters:
+        key (str): name of the counter
+        value (int): value to set the counter to
+        crs (Cursor): cursor of the transaction to set the counter in, None to
+            set it in its own transaction
+        """
+        db = self.connect()
+        commit = crs is None
+        if commit:
+            crs = db.cursor()
+        query = "INSERT INTO " + self.META_TABLE_FILE + "(`key`, `value`)" + \
+            "VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET " + \
+            "value = excluded.value"
+        crs.execute(query, (key, value))
+        if commit:
+            db.commit()
+
+    def get_content_state(self):
+        """
+        Return the values that change whenever entries are written or
+        deleted.
+
+        Returns:
+        tuple: highest entry id, newest entry date, number of deletions and
+            unix time of the last change, each None if there is none yet
+        """
+        db = self.connect()
+        crs = db.cursor()
+        meta = "(SELECT value FROM " + self.META_TABLE_FILE + " WHERE key = ?)"
+        query = "SELECT MAX(id), MAX(date), " + meta + ", " + meta + \
+            " FROM " + self.ENTRY_TABLE_FILE
+        crs.execute(query, ("deletions", "modified"))
+        return crs.fetchone()
+
+    def get_generation(self):
+        """
+        Return the generation of the content, which changes on every write.
+
+        Returns:
+        int: generation of the content
+        """
+        return self.get_counter("generation")
 
     def insert_user(self, username, password):
         """
@@ -212,8 +742,10 @@ class Database:
         Returns:
         int: number of the line the row was added, None if it wasn't successful
         """
+        if self.get_user_by_name(username) is not None:
+            return None
         pass_hash = generate_password_hash(password)
-        if self.get_user_by_name(username) is None and pass_hash is not None:
+        if pass_hash is not None:
             db = self.connect()
             crs = db.cursor()
             query = "INSERT INTO " + self.USER_TABLE_FILE + \
@@ -221,6 +753,11 @@ class Database:
                     "VALUES (?, ?) ON CONFLICT DO NOTHING"
             crs.execute(query, (username, pass_hash))
             db.commit()
+            # the name may have been taken since it was checked, lastrowid is
+            # then left over from an earlier insert of the connection
+            if crs.rowcount == 0:
+                return None
+            self.forget_user(crs.lastrowid, username)
             return crs.lastrowid
         return None
 
@@ -249,11 +786,17 @@ class Database:
         item_id = crs.fetchone()[0]
         date = dt.today().strftime('%Y-%m-%d')
         query = "INSERT INTO " + self.ENTRY_TABLE_FILE + \
-            "(`item_id`, `text`, `rating`, `user_id`, `date`)" + \
-            "VALUES (?, ?, ?, ?, ?)"
-        crs.execute(query, (item_id, text, rating, user_id, date))
+            "(`item_id`, `text`, `plain`, `rating`, `user_id`, `date`)" + \
+            "VALUES (?, ?, ?, ?, ?, ?)"
+        crs.execute(query, (item_id, text, html_to_text(text), rating,
+                            user_id, date))
+        ident = crs.lastrowid
+        self.add_item_rating(item_id, rating, crs)
+        self.set_counter("modified", int(time.time()), crs)
+        self.enqueue_job("index_entry", ident, crs)
+        self.increase_counter("generation", crs)
         db.commit()
-        return crs.lastrowid
+        return ident
 
     def delete_entry(self, ident):
         """
@@ -267,26 +810,219 @@ class Database:
         """
         db = self.connect()
         crs = db.cursor()
+        query = "SELECT item_id, rating FROM " + self.ENTRY_TABLE_FILE + \
+            " WHERE id = ?"
+        crs.execute(query, (ident, ))
+        fetched = crs.fetchone()
         query = "DELETE FROM " + self.ENTRY_TABLE_FILE + " WHERE id = ?"
         crs.execute(query, (ident, ))
+        res = crs.lastrowid
+        if fetched is not None:
+            self.remove_item_rating(fetched[0], fetched[1], crs)
+        self.increase_counter("deletions", crs)
+        self.set_counter("modified", int(time.time()), crs)
+        self.enqueue_job("unindex_entry", ident, crs)
+        self.increase_counter("generation", crs)
+        db.commit()
+        return res
+
+    def insert_entries(self, rows, batch=1000):
+        """
+        Insert many rows in the entry table in a single transaction.
+        Items are shared by name and date, users that don't exist yet are
+        created with a password that never matches.
+        The search index is not updated, it has to be rebuilt afterwards.
+
+        Parameters:
+        rows (Iterable(tuple)): item name, item date, text, rating, user name
+            and date of the entries to add, the date None for today
+        batch (int): number of entries inserted at once
+
+        Returns:
+        int: number of added entries
+        """
+        db = self.connect()
+        crs = db.cursor()
+        crs.execute("SELECT id, name, date FROM " + self.ITEM_TABLE_FILE)
+        items = {(name, date): ident for ident, name, date in crs.fetchall()}
+        crs.execute("SELECT id, name FROM " + self.USER_TABLE_FILE)
+        users = {name: ident for ident, name in crs.fetchall()}
+        today = dt.today().strftime('%Y-%m-%d')
+        item_query = "INSERT INTO " + self.ITEM_TABLE_FILE + \
+            "(`name`,`date`)" + "VALUES (?, ?)"
+        user_query = "INSERT INTO " + self.USER_TABLE_FILE + \
+            "(`name`,`password`)" + "VALUES (?, '!')"
+        entry_query = "INSERT INTO " + self.ENTRY_TABLE_FILE + \
+            "(`item_id`, `text`, `plain`, `rating`, `user_id`, `date`)" + \
+            "VALUES (?, ?, ?, ?, ?, ?)"
+        count = 0
+        pending = []
+        try:
+            for name, date, text, rating, username, written in rows:
+                if (name, date) not in items:
+                    crs.execute(item_query, (name, date))
+                    items[(name, date)] = crs.lastrowid
+                if username is not None and username not in users:
+                    crs.execute(user_query, (username, ))
+                    users[username] = crs.lastrowid
+                pending.append((items[(name, date)], text, html_to_text(text),
+                                rating, users.get(username), written or today))
+                if len(pending) >= batch:
+                    crs.executemany(entry_query, pending)
+                    count += len(pending)
+                    pending = []
+            crs.executemany(entry_query, pending)
+            count += len(pending)
+            self.fill_item_stats(crs)
+            self.set_counter("modified", int(time.time()), crs)
+            self.increase_counter("generation", crs)
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        return count
+
+    def enqueue_job(self, kind, payload=None, crs=None):
+        """
+        Insert a row in the job table for the background worker.
+
+        Parameters:
+        kind (str): kind of the job
+        payload (int): argument of the job
+        crs (Cursor): cursor of the transaction to insert the job in, None to
+            insert it in its own transaction
+        """
+        db = self.connect()
+        commit = crs is None
+        if commit:
+            crs = db.cursor()
+        query = "INSERT INTO " + self.JOB_TABLE_FILE + \
+            "(`kind`, `payload`, `run_at`) VALUES (?, ?, ?)"
+        crs.execute(query, (kind, payload, time.time()))
+        if commit:
+            db.commit()
+
+    def claim_job(self, lease):
+        """
+        Lock the oldest job that is due so no other worker runs it.
+
+        Parameters:
+        lease (float): seconds after which the lock expires if the job
+            wasn't finished
+
+        Returns:
+        tuple: id, kind, payload and number of attempts of the job, None if
+            no job is due
+        """
+        db = self.connect()
+        crs = db.cursor()
+        now = time.time()
+        crs.execute("BEGIN IMMEDIATE")
+        try:
+            query = "SELECT id, kind, payload, attempts FROM " + \
+                self.JOB_TABLE_FILE + " WHERE run_at <= ? AND " + \
+                "(locked_until IS NULL OR locked_until < ?) " + \
+                "ORDER BY run_at, id LIMIT 1"
+            crs.execute(query, (now, now))
+            job = crs.fetchone()
+            if job is not None:
+                query = "UPDATE " + self.JOB_TABLE_FILE + \
+                    " SET locked_until = ?, attempts = attempts + 1 " + \
+                    "WHERE id = ?"
+                crs.execute(query, (now + lease, job[0]))
+                job = job[:3] + (job[3] + 1, )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return job
+
+    def finish_job(self, ident):
+        """
+        Delete a job that ran successfully.
+
+        Parameters:
+        ident (int): id of the job
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = "DELETE FROM " + self.JOB_TABLE_FILE + " WHERE id = ?"
+        crs.execute(query, (ident, ))
+        db.commit()
+
+    def fail_job(self, ident, error, delay=None):
+        """
+        Unlock a job that failed so it is run again later.
+
+        Parameters:
+        ident (int): id of the job
+        error (str): description of the error
+        delay (float): seconds to wait before the next attempt, None to
+            never run the job again
+        """
+        db = self.connect()
+        crs = db.cursor()
+        run_at = None if delay is None else time.time() + delay
+        query = "UPDATE " + self.JOB_TABLE_FILE + \
+            " SET locked_until = NULL, run_at = ?, error = ? WHERE id = ?"
+        crs.execute(query, (run_at, error, ident))
         db.commit()
-        return crs.lastrowid
 
-    def get_entries(self):
+    def entry_query(self, text=True, plain=False):
+        """
+        Return the query that selects entries joined with their items and
+        users.
+        The columns are ordered as expected by entries_from_db, password
+        hashes of the users are never selected.
+
+        Parameters:
+        text (bool): False to leave out the texts so they are loaded lazily
+        plain (bool): True to select the texts without html
+
+        Returns:
+        str: query selecting the joined entry rows
+        """
+        return "SELECT e.id, " + ("e.text" if text else "NULL") + ", " + \
+            ("e.plain" if plain else "NULL") + \
+            ", e.rating, e.date, i.id, i.name, i.date, u.id, u.name FROM " + \
+            self.ENTRY_TABLE_FILE + " AS e JOIN " + self.ITEM_TABLE_FILE + \
+            " AS i ON i.id = e.item_id LEFT JOIN " + self.USER_TABLE_FILE + \
+            " AS u ON u.id = e.user_id"
+
+    def get_entries(self, text=True, plain=False):
         """
         Return all the entries stored in the database.
 
+        Parameters:
+        text (bool): False to load the texts lazily
+        plain (bool): True to select the texts without html
+
         Return:
         List(Entry): list of entries in database
         """
         db = self.connect()
         crs = db.cursor()
-        query = "SELECT * FROM " + self.ENTRY_TABLE_FILE
+        query = self.entry_query(text, plain) + " ORDER BY e.id"
         crs.execute(query)
-        res = []
-        for item in crs.fetchall():
-            res.append(self.entry_from_db(*item))
-        return res
+        return self.entries_from_db(crs.fetchall())
+
+    def iter_entry_rows(self):
+        """
+        Return all the entries stored in the database row by row without
+        creating objects for them.
+
+        Returns:
+        Iterator(tuple): item name, item date, text, rating, user name and date
+            of every entry in the order they were written
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = "SELECT i.name, i.date, e.text, e.rating, u.name, e.date " + \
+            "FROM " + self.ENTRY_TABLE_FILE + " AS e JOIN " + \
+            self.ITEM_TABLE_FILE + " AS i ON i.id = e.item_id LEFT JOIN " + \
+            self.USER_TABLE_FILE + " AS u ON u.id = e.user_id ORDER BY e.id"
+        crs.execute(query)
+        return iter(crs)
 
     def get_entry_by_id(self, ident):
         """
@@ -300,13 +1036,55 @@ class Database:
         """
         db = self.connect()
         crs = db.cursor()
-        query = "SELECT * FROM " + self.ENTRY_TABLE_FILE + " WHERE id = ?"
+        query = self.entry_query(True, True) + " WHERE e.id = ?"
         crs.execute(query, (ident, ))
         fetched = crs.fetchone()
         if fetched is None:
             return None
         else:
-            return self.entry_from_db(*fetched)
+            return self.entries_from_db([fetched])[0]
+
+    def get_entry_text(self, ident):
+        """
+        Return the text of an entry stored in the database.
+
+        Parameters:
+        ident (int): id of the entry
+
+        Returns:
+        str: text of the entry, None if there is no such entry
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = "SELECT text FROM " + self.ENTRY_TABLE_FILE + " WHERE id = ?"
+        crs.execute(query, (ident, ))
+        fetched = crs.fetchone()
+        if fetched is None:
+            return None
+        return fetched[0]
+
+    def get_entries_by_ids(self, idents, text=True):
+        """
+        Return the entries stored in the database that match the given ids.
+
+        Parameters:
+        idents (List(int)): ids of the entries to return
+        text (bool): False to load the texts lazily
+
+        Returns:
+        List(Entry): entries that matched the ids in the order of the ids
+        """
+        idents = [int(ident) for ident in idents]
+        if idents == []:
+            return []
+        db = self.connect()
+        crs = db.cursor()
+        query = self.entry_query(text) + " WHERE e.id IN (" + \
+            ", ".join("?" * len(idents)) + ")"
+        crs.execute(query, idents)
+        entries = {entry.id: entry
+                   for entry in self.entries_from_db(crs.fetchall())}
+        return [entries[ident] for ident in idents if ident in entries]
 
     def get_entries_by_username(self, username):
         """
@@ -320,18 +1098,178 @@ class Database:
         """
         db = self.connect()
         crs = db.cursor()
-        query = "SELECT * FROM " + self.ENTRY_TABLE_FILE + \
-                " WHERE user_id = (SELECT id FROM " + self.USER_TABLE_FILE + \
-                " WHERE name = ?)"
+        query = self.entry_query() + " WHERE u.name = ? ORDER BY e.id"
         crs.execute(query, (username, ))
+        return self.entries_from_db(crs.fetchall())
+
+    def get_entries_page(self, before=None, after=None, number=10,
+                         text=True, plain=False):
+        """
+        Return a page of entries with the newest entries first.
+
+        Parameters:
+        before (int): id of the entry the page follows, None to start with the
+            newest entry
+        after (int): id of the entry the page precedes, None if before is used
+        number (int): maximum number of entries to return
+        text (bool): False to load the texts lazily
+        plain (bool): True to select the texts without html
+
+        Returns:
+        List(Entry): entries of the page
+        """
+        return self.get_page(self.RECENT_ORDER, before, after, number,
+                             text=text, plain=plain)
+
+    def get_entries_by_username_page(self, username, before=None, after=None,
+                                     number=10):
+        """
+        Return a page of the entries of a user ordered like the archive.
+        The texts of the entries are loaded lazily.
+
+        Parameters:
+        username (str): name of the user whose entries to return
+        before (int): id of the entry the page follows, None to start with the
+            first entry
+        after (int): id of the entry the page precedes, None if before is used
+        number (int): maximum number of entries to return
+
+        Returns:
+        List(Entry): entries of the page
+        """
+        return self.get_page(self.ARCHIVE_ORDER, before, after, number,
+                             "u.name = ?", (username, ), False)
+
+    def get_page(self, order, before, after, number, where=None, params=(),
+                 text=True, plain=False):
+        """
+        Return a page of entries using keyset pagination.
+        The page starts right after the entry before (or ends right before the
+        entry after) in the given order, so no skipped rows are read.
+
+        Parameters:
+        order (List(tuple)): columns of the order with True for descending
+        before (int): id of the entry the page follows
+        after (int): id of the entry the page precedes
+        number (int): maximum number of entries to return
+        where (str): additional condition entries have to match
+        params (tuple): parameters of the additional condition
+        text (bool): False to load the texts lazily
+        plain (bool): True to select the texts without html
+
+        Returns:
+        List(Entry): entries of the page
+        """
+        db = self.connect()
+        crs = db.cursor()
+        conditions = []
+        args = list(params)
+        if where is not None:
+            conditions.append(where)
+        cursor = before if before is not None else after
+        backwards = before is None and after is not None
+        if cursor is not None:
+            query = "SELECT " + ", ".join(col for col, _ in order) + \
+                " FROM " + self.ENTRY_TABLE_FILE + " AS e JOIN " + \
+                self.ITEM_TABLE_FILE + " AS i ON i.id = e.item_id" + \
+                " WHERE e.id = ?"
+            crs.execute(query, (cursor, ))
+            key = crs.fetchone()
+            if key is None:
+                return []
+            keyset = []
+            for pos, (col, desc) in enumerate(order):
+                comp = "<" if desc != backwards else ">"
+                equal = [c + " = ?" for c, _ in order[:pos]]
+                keyset.append("(" + " AND ".join(equal + [col + comp + "?"]) +
+                              ")")
+                args.extend(key[:pos + 1])
+            conditions.append("(" + " OR ".join(keyset) + ")")
+        query = self.entry_query(text, plain)
+        if conditions != []:
+            query += " WHERE " + " AND ".join(conditions)
+        query += self.order_clause(order, backwards) + " LIMIT ?"
+        args.append(number)
+        crs.execute(query, args)
+        res = self.entries_from_db(crs.fetchall())
+        if backwards:
+            res.reverse()
+        return res
+
+    def order_clause(self, order, backwards=False):
+        """
+        Return the ORDER BY clause of an order of entries.
+
+        Parameters:
+        order (List(tuple)): columns of the order with True for descending
+        backwards (bool): True to reverse the order
+
+        Returns:
+        str: ORDER BY clause of the order
+        """
+        return " ORDER BY " + ", ".join(
+            col + (" DESC" if desc != backwards else " ASC")
+            for col, desc in order)
+
+    def get_archive(self):
+        """
+        Return all the entries stored in the database grouped for the archive.
+        The texts of the entries are loaded lazily.
+
+        Returns:
+        List(tuple): release years with their items and the items with their
+            entries, see group_entries
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = self.entry_query(False) + \
+            self.order_clause(self.ARCHIVE_ORDER)
+        crs.execute(query)
+        return self.group_entries(self.entries_from_db(crs.fetchall()))
+
+    def group_entries(self, entries):
+        """
+        Group entries in archive order by the release year and item.
+
+        Parameters:
+        entries (List(Entry)): entries ordered by ARCHIVE_ORDER
+
+        Returns:
+        List(tuple): release years with the list of their items, each item
+            in a tuple with the list of its entries
+        """
         res = []
-        for item in crs.fetchall():
-            res.append(self.entry_from_db(*item))
+        for entry in entries:
+            if res == [] or res[-1][0] != entry.item.date:
+                res.append((entry.item.date, []))
+            items = res[-1][1]
+            if items == [] or items[-1][0].id != entry.item.id:
+                items.append((entry.item, []))
+            items[-1][1].append(entry)
         return res
 
+    def get_entry_owners(self):
+        """
+        Return the ids of all entries with the names of their authors and the
+        ids of their items.
+
+        Returns:
+        dict: names of the authors and ids of the items by the ids of the
+            entries
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = "SELECT e.id, u.name, e.item_id FROM " + \
+            self.ENTRY_TABLE_FILE + " AS e LEFT JOIN " + \
+            self.USER_TABLE_FILE + " AS u ON u.id = e.user_id"
+        crs.execute(query)
+        return {ident: (name, item_id) for ident, name, item_id in
+                crs.fetchall()}
+
     def get_item_by_id(self, ident):
         """
-        Return an item stored in the database based on the items id.
+        Return an item stored in the database based on the items id together
+        with its aggregated ratings.
 
         Parameters:
         ident (int): id of the item to return
@@ -341,17 +1279,83 @@ class Database:
         """
         db = self.connect()
         crs = db.cursor()
-        query = "SELECT * FROM " + self.ITEM_TABLE_FILE + " WHERE id = ?"
+        query = self.item_query() + " WHERE i.id = ?"
         crs.execute(query, (ident, ))
         fetched = crs.fetchone()
         if fetched is None:
             return None
         else:
-            return self.item_from_db(*fetched)
+            return self.item_stats_from_db(*fetched)
+
+    def get_items(self):
+        """
+        Return all the items stored in the database.
+
+        Returns:
+        List(Item): list of items in database
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = "SELECT id, name, date FROM " + self.ITEM_TABLE_FILE
+        crs.execute(query)
+        return [self.item_from_db(*row) for row in crs.fetchall()]
+
+    def get_top_items(self, number=10):
+        """
+        Return the items with the best average rating.
+
+        Parameters:
+        number (int): maximum number of items to return
+
+        Returns:
+        List(Item): rated items with the best first
+        """
+        db = self.connect()
+        crs = db.cursor()
+        query = self.item_query("INNER") + " ORDER BY " + self.TOP_ORDER + \
+            " LIMIT ?"
+        crs.execute(query, (number, ))
+        return [self.item_stats_from_db(*row) for row in crs.fetchall()]
+
+    def item_query(self, join="LEFT"):
+        """
+        Return the query that selects items joined with their aggregated
+        ratings.
+
+        Parameters:
+        join (str): kind of the join, LEFT to include items without ratings,
+            INNER to select rated items only
+
+        Returns:
+        str: query selecting the item rows as expected by item_stats_from_db
+        """
+        return "SELECT i.id, i.name, i.date, s.count, s.total, s.minimum, " + \
+            "s.maximum FROM " + self.ITEM_TABLE_FILE + " AS i " + join + \
+            " JOIN " + self.ITEM_STATS_TABLE_FILE + " AS s ON s.item_id = i.id"
+
+    def get_entries_by_item_page(self, item_id, before=None, after=None,
+                                 number=10):
+        """
+        Return a page of the entries of an item with the best rated first.
+        The texts of the entries are loaded lazily.
+
+        Parameters:
+        item_id (int): id of the item whose entries to return
+        before (int): id of the entry the page follows, None to start with the
+            first entry
+        after (int): id of the entry the page precedes, None if before is used
+        number (int): maximum number of entries to return
+
+        Returns:
+        List(Entry): entries of the page
+        """
+        return self.get_page(self.ITEM_ORDER, before, after, number,
+                             "e.item_id = ?", (item_id, ), False)
 
     def get_user_by_id(self, ident):
         """
         Return a user stored in the database based on the users id.
+        Found users are cached for a short time, missing ones are not.
 
         Parameters:
         ident (int): id of the user to return
@@ -359,6 +1363,9 @@ class Database:
         Returns:
         Item: user that matched the given id
         """
+        user = self.manager.users.get(("id", int(ident)))
+        if user is not None:
+            return user
         db = self.connect()
         crs = db.cursor()
         query = "SELECT * FROM " + self.USER_TABLE_FILE + " WHERE id = ?"
@@ -367,11 +1374,12 @@ class Database:
         if fetched is None:
             return None
         else:
-            return self.user_from_db(*fetched)
+            return self.cache_user(self.user_from_db(*fetched))
 
     def get_user_by_name(self, name):
         """
         Return a user stored in the database based on the user name.
+        Found users are cached for a short time, missing ones are not.
 
         Parameters:
         name (str): name of the user to return
@@ -379,6 +1387,9 @@ class Database:
         Returns:
         Entry: user that matched the given name
         """
+        user = self.manager.users.get(("name", name))
+        if user is not None:
+            return user
         db = self.connect()
         crs = db.cursor()
         query = "SELECT * FROM " + self.USER_TABLE_FILE + " WHERE name = ?"
@@ -387,16 +1398,42 @@ class Database:
         if fetched is None:
             return None
         else:
-            return self.user_from_db(*fetched)
+            return self.cache_user(self.user_from_db(*fetched))
+
+    def cache_user(self, user):
+        """
+        Store a loaded user in the user cache by its id and name.
+
+        Parameters:
+        user (User): user to store
+
+        Returns:
+        User: the stored user
+        """
+        self.manager.users.set(("id", user.id), user)
+        self.manager.users.set(("name", user.name), user)
+        return user
+
+    def forget_user(self, ident, name):
+        """
+        Remove a user from the user cache after it was created or changed.
+        Other processes keep their cached user until it expires.
+
+        Parameters:
+        ident (int): id of the user
+        name (str): name of the user
+        """
+        self.manager.users.delete(("id", ident))
+        self.manager.users.delete(("name", name))
 
-    def user_from_db(self, ident, name, pass_hash):
+    def user_from_db(self, ident, name, pass_hash=None):
         """
         Return a user from given database parameters.
 
         Parameters:
         ident: id of the user
         name: text of the user
-        pass_hash: password hash of the user
+        pass_hash: password hash of the user, None if it wasn't selected
 
         Returns:
         User: user element with given variables
@@ -421,23 +1458,77 @@ class Database:
         item.set_id(ident)
         return item
 
-    def entry_from_db(self, ident, item_id, text, rating, user_id, date):
+    def item_stats_from_db(self, ident, name, date, count, total, minimum,
+                           maximum):
+        """
+        Return an item with its aggregated ratings from given database
+        parameters.
+
+        Parameters:
+        ident: id of the item
+        name: text of the item
+        date: date of the day the item was created
+        count: number of entries rating the item, None if there are none
+        total: sum of the ratings of the item
+        minimum: lowest rating of the item
+        maximum: highest rating of the item
+
+        Returns:
+        Item: item element with given variables
+        """
+        item = self.item_from_db(ident, name, date)
+        item.set_stats(count, total, minimum, maximum)
+        return item
+
+    def entry_from_db(self, ident, text, rating, date, item, user,
+                      plain=None):
         """
         Return an entry from given database parameters.
 
         Parameters:
         ident: id of the entry
-        item_id: id of the referenced item
-        text: text of the entry
+        text: text of the entry, None to load it lazily
         rating: rating of the entry
-        user_id: id of the user that authored the entry
         date: date of the day the entry was written
+        item: item referenced by the entry
+        user: user that authored the entry
+        plain: text of the entry without html, None if it wasn't selected
 
         Returns:
         Entry: entry element with given variables
         """
-        entry = Entry(text, rating, date)
+        entry = Entry(text, rating, date, self.get_entry_text)
         entry.set_id(ident)
-        entry.set_item(self.get_item_by_id(item_id))
-        entry.set_user(self.get_user_by_id(user_id))
+        entry.set_item(item)
+        entry.set_user(user)
+        entry.set_plain(plain)
         return entry
+
+    def entries_from_db(self, rows):
+        """
+        Return entries from rows selected by the query of entry_query.
+        Items and users are only created once for all rows, so entries that
+        share them reference the same objects.
+
+        Parameters:
+        rows: rows of joined entries, items and users
+
+        Returns:
+        List(Entry): entry elements with given variables
+        """
+        items = {}
+        users = {}
+        res = []
+        for ident, text, plain, rating, date, item_id, item_name, item_date, \
+                user_id, user_name in rows:
+            item = items.get(item_id)
+            if item is None:
+                item = self.item_from_db(item_id, item_name, item_date)
+                items[item_id] = item
+            user = users.get(user_id)
+            if user is None and user_id is not None:
+                user = self.user_from_db(user_id, user_name)
+                users[user_id] = user
+            res.append(self.entry_from_db(ident, text, rating, date, item,
+                                          user, plain))
+        return res
@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import shutil
+from urllib.parse import unquote
+
+from flask import url_for
+from werkzeug.security import safe_join
+
+import config
+from app import ASSET_VERSION, app, db
+
+STATE_FILE = ".export.json"
+
+
+def page_path(directory, url):
+    """
+    Return the path of the file a page is exported to.
+
+    Parameters:
+    directory (PathLike): directory of the export
+    url (str): url of the page
+
+    Returns:
+    PathLike: path of the file that stores the page, None if it would not be
+        inside the directory
+    """
+    parts = [part for part in unquote(url).split("/") if part != ""]
+    if any(part in (".", "..") for part in parts):
+        return None
+    path = safe_join(directory, *parts, "index.html")
+    if path is None:
+        return None
+    root = os.path.realpath(directory)
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        return None
+    return path
+
+
+def write_page(client, directory, url):
+    """
+    Render a page and store it in the export.
+
+    Parameters:
+    client (FlaskClient): client to request the page with
+    directory (PathLike): directory of the export
+    url (str): url of the page
+
+    Returns:
+    bool: True if the page exists and was stored, False otherwise
+    """
+    path = page_path(directory, url)
+    if path is None:
+        return False
+    website = config.WEBSITE
+    if "://" not in website:
+        website = "http://" + website
+    response = client.get(url, base_url=website)
+    if response.status_code != 200:
+        remove_page(directory, url)
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        file.write(response.get_data())
+    os.replace(path + ".tmp", path)
+    return True
+
+
+def remove_page(directory, url):
+    """
+    Remove an exported page.
+    Pages that would not be inside the directory are never removed.
+
+    Parameters:
+    directory (PathLike): directory of the export
+    url (str): url of the page
+    """
+    path = page_path(directory, url)
+    if path is None or os.path.realpath(os.path.dirname(path)) == \
+            os.path.realpath(directory):
+        return
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def load_state(directory):
+    """
+    Load the entries of the last export.
+
+    Parameters:
+    directory (PathLike): directory of the export
+
+    Returns:
+    dict: names of the authors and ids of the items by the ids of the
+        exported entries, None if there was no export yet
+    """
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as file:
+            return {int(ident): (name, item_id)
+                    for ident, (name, item_id) in json.load(file).items()}
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def save_state(directory, owners):
+    """
+    Store the entries of the current export.
+
+    Parameters:
+    directory (PathLike): directory of the export
+    owners (dict): names of the authors and ids of the items by the ids of
+        the exported entries
+    """
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + ".tmp", "w") as file:
+        json.dump(owners, file)
+    os.replace(path + ".tmp", path)
+
+
+def export(directory, full=False):
+    """
+    Export the blog into a directory of static pages.
+    Only pages affected by entries that were written or deleted since the
+    last export are rendered again, unless a full export is requested.
+    Paginated pages are only exported with their first page.
+
+    Parameters:
+    directory (PathLike): directory of the export
+    full (bool): True to render all pages again
+
+    Returns:
+    int: number of rendered pages
+    """
+    owners = db.get_entry_owners()
+    previous = None if full else load_state(directory)
+    if previous is None:
+        previous = {}
+        entries = set(owners)
+        changed = set(owners.values())
+        shutil.copytree(app.static_folder, os.path.join(directory, "static"),
+                        dirs_exist_ok=True)
+        shutil.copytree(app.static_folder,
+                        os.path.join(directory, "assets", ASSET_VERSION),
+                        dirs_exist_ok=True)
+    else:
+        entries = set(owners) - set(previous)
+        deleted = set(previous) - set(owners)
+        changed = {owners[ident] for ident in entries} | \
+            {previous[ident] for ident in deleted}
+        for ident in deleted:
+            with app.test_request_context():
+                remove_page(directory, url_for("entry", ident=ident))
+        if entries == set() and deleted == set():
+            return 0
+    users = {name for name, _ in changed if name is not None}
+    items = {item_id for _, item_id in changed}
+    client = app.test_client()
+    with app.test_request_context():
+        urls = [url_for(endpoint)
+                for endpoint in ["index", "archive", "top", "feed"]] + \
+            [url_for("entry", ident=ident) for ident in sorted(entries)] + \
+            [url_for("user", name=name) for name in sorted(users)] + \
+            [url_for("item", ident=item_id) for item_id in sorted(items)]
+    for url in urls:
+        write_page(client, directory, url)
+    save_state(directory, owners)
+    return len(urls)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the blog into static pages.")
+    parser.add_argument("directory", nargs="?", default=config.EXPORT_DIR,
+                        help="directory to export to")
+    parser.add_argument("--full", action="store_true",
+                        help="render all pages instead of changed ones")
+    args = parser.parse_args()
+    print("Rendered " + str(export(args.directory, args.full)) + " pages.")
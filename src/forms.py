@@ -34,9 +34,12 @@ class RegisterForm(FlaskForm):
 class SearchForm(FlaskForm):
     """
     A Class for the Form that is used while searching.
+    It is sent with GET, so it has no CSRF token.
     """
-    query_str = StringField(
-        "Query", [DataRequired("Please enter the search term")])
+    class Meta:
+        csrf = False
+
+    q = StringField("Query", [DataRequired("Please enter the search term")])
     submit = SubmitField("Search")
 
 
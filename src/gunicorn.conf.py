@@ -0,0 +1,21 @@
+from config import BIND, THREADS, WORKERS
+
+# Configuration of the production server, run it with:
+# gunicorn -c gunicorn.conf.py app:app
+
+bind = BIND
+workers = WORKERS
+threads = THREADS
+worker_class = "gthread"
+
+
+def post_worker_init(worker):
+    """
+    Starts the background jobs in every serving process, command line tools
+    that only import the app don't run them.
+
+    Parameters:
+    worker (Worker): worker process that loaded the app
+    """
+    from jobs import job_queue
+    job_queue.start()
@@ -0,0 +1,126 @@
+import os
+import threading
+import traceback
+
+import config
+from database import Database
+import metrics
+from search import add_entry_to_index, create_search_index, \
+    remove_entry_from_index
+
+db = Database()
+
+
+def index_entry(ident):
+    """
+    Add a written entry to the search index.
+
+    Parameters:
+    ident (int): id of the entry
+    """
+    entry = db.get_entry_by_id(ident)
+    if entry is not None:
+        add_entry_to_index(entry)
+
+
+def unindex_entry(ident):
+    """
+    Remove a deleted entry from the search index.
+
+    Parameters:
+    ident (int): id of the entry
+    """
+    remove_entry_from_index(ident)
+
+
+def rebuild_index(_):
+    """
+    Rebuild the search index after the indexed documents changed.
+    """
+    create_search_index()
+
+
+HANDLERS = {"index_entry": index_entry, "unindex_entry": unindex_entry,
+            "rebuild_index": rebuild_index}
+
+
+class JobQueue():
+    """
+    A class to run the jobs stored in the job table in a background thread.
+    Jobs are enqueued by the database in the transaction of the write that
+    caused them, so they survive restarts until they ran successfully.
+
+    Attributes:
+    LEASE (float): seconds a claimed job is locked for other workers
+    event (Event): event that wakes the worker up early
+    pid (int): id of the process the worker thread was started in
+    lock (Lock): lock that guards starting the worker thread
+    """
+
+    LEASE = 300
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker thread of the current process if it isn't running.
+        """
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            thread = threading.Thread(target=self.work, name="jobs",
+                                      daemon=True)
+            thread.start()
+            self.pid = os.getpid()
+
+    def notify(self):
+        """
+        Wake up the worker thread to run newly enqueued jobs.
+        """
+        self.event.set()
+
+    def run_pending(self):
+        """
+        Run all jobs that are due.
+
+        Returns:
+        int: number of jobs that were run
+        """
+        number = 0
+        while True:
+            job = db.claim_job(self.LEASE)
+            if job is None:
+                return number
+            ident, kind, payload, attempts = job
+            number += 1
+            try:
+                HANDLERS[kind](payload)
+            except Exception:
+                delay = 2 ** attempts if attempts < config.JOB_ATTEMPTS \
+                    else None
+                db.fail_job(ident, traceback.format_exc(), delay)
+            else:
+                db.finish_job(ident)
+
+    def work(self):
+        """
+        Run jobs until the process exits.
+        """
+        while True:
+            self.event.clear()
+            try:
+                self.run_pending()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                db.close()
+                metrics.request_stats.reset()
+            self.event.wait(config.JOB_POLL_INTERVAL)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class RateLimiter():
+    """
+    A class to represent token buckets that limit the rate of attempts by key.
+    Every bucket holds up to burst tokens and gains rate tokens per second.
+    Only the least recently used buckets are kept, a forgotten bucket starts
+    full again.
+
+    Attributes:
+    rate (float): tokens added to a bucket per second
+    burst (int): maximum number of tokens of a bucket
+    size (int): maximum number of stored buckets
+    buckets (OrderedDict): tokens and time of the last update by key
+    lock (Lock): lock that guards the buckets
+    """
+
+    def __init__(self, rate, burst, size=4096):
+        self.rate = rate
+        self.burst = burst
+        self.size = size
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def allow(self, *keys):
+        """
+        Take a token from the buckets of all given keys if every one has one.
+
+        Parameters:
+        keys (tuple): keys of the buckets
+
+        Returns:
+        bool: True if the attempt is allowed, False if it is limited
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens = []
+            for key in keys:
+                left, updated = self.buckets.get(key, (self.burst, now))
+                tokens.append(min(self.burst,
+                                  left + (now - updated) * self.rate))
+            allowed = all(left >= 1 for left in tokens)
+            for key, left in zip(keys, tokens):
+                self.buckets[key] = (left - allowed, now)
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > self.size:
+                self.buckets.popitem(last=False)
+        return allowed
+
+
+class BoundedExecutor():
+    """
+    A class to run expensive functions on a fixed number of threads with a
+    bounded number of waiting calls, so they can't occupy every thread that
+    handles requests.
+
+    Attributes:
+    executor (ThreadPoolExecutor): threads that run the functions
+    slots (Semaphore): free places for running and waiting calls
+    """
+
+    def __init__(self, workers, queue):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    def run(self, func, *args):
+        """
+        Run a function on the executor and wait for its result.
+
+        Parameters:
+        func (function): function to run
+        args (tuple): arguments of the function
+
+        Returns:
+        tuple: True and the result of the function, False and None if the
+            executor was full
+        """
+        if not self.slots.acquire(blocking=False):
+            return False, None
+        try:
+            return True, self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
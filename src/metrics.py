@@ -0,0 +1,246 @@
+import threading
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(names, values, extra=None):
+    """
+    Format labels in the Prometheus text format.
+
+    Parameters:
+    names (tuple): names of the labels
+    values (tuple): values of the labels
+    extra (tuple): additional name and value of a label, None if there is none
+
+    Returns:
+    str: formatted labels, empty if there are none
+    """
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if pairs == []:
+        return ""
+    return "{" + ",".join(
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') +
+        '"' for name, value in pairs) + "}"
+
+
+class Counter():
+    """
+    A class to represent a Prometheus counter.
+
+    Attributes:
+    name (str): name of the metric
+    description (str): help text of the metric
+    labels (tuple): names of the labels
+    values (dict): values of the counter by the values of the labels
+    lock (Lock): lock that guards the values
+    """
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, *labels):
+        """
+        Increase the counter.
+
+        Parameters:
+        amount (float): amount to increase the counter by
+        labels (str): values of the labels
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        """
+        Render the counter in the Prometheus text format.
+
+        Returns:
+        List(str): lines of the counter
+        """
+        lines = ["# HELP " + self.name + " " + self.description,
+                 "# TYPE " + self.name + " counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(self.name + format_labels(self.labels, labels) +
+                             " " + repr(float(value)))
+        return lines
+
+
+class Histogram():
+    """
+    A class to represent a Prometheus histogram.
+
+    Attributes:
+    name (str): name of the metric
+    description (str): help text of the metric
+    labels (tuple): names of the labels
+    buckets (tuple): upper bounds of the buckets
+    values (dict): bucket counts, sum and count by the values of the labels
+    lock (Lock): lock that guards the values
+    """
+
+    def __init__(self, name, description, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        """
+        Add an observed value to the histogram.
+
+        Parameters:
+        value (float): observed value
+        labels (str): values of the labels
+        """
+        with self.lock:
+            counts, total, count = self.values.get(
+                labels, ([0] * len(self.buckets), 0, 0))
+            counts = [c + (value <= bound)
+                      for c, bound in zip(counts, self.buckets)]
+            self.values[labels] = (counts, total + value, count + 1)
+
+    def render(self):
+        """
+        Render the histogram in the Prometheus text format.
+
+        Returns:
+        List(str): lines of the histogram
+        """
+        lines = ["# HELP " + self.name + " " + self.description,
+                 "# TYPE " + self.name + " histogram"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket in zip(self.buckets, counts):
+                    lines.append(self.name + "_bucket" + format_labels(
+                        self.labels, labels, ("le", bound)) + " " +
+                        str(bucket))
+                lines.append(self.name + "_bucket" + format_labels(
+                    self.labels, labels, ("le", "+Inf")) + " " + str(count))
+                lines.append(self.name + "_sum" +
+                             format_labels(self.labels, labels) + " " +
+                             repr(float(total)))
+                lines.append(self.name + "_count" +
+                             format_labels(self.labels, labels) + " " +
+                             str(count))
+        return lines
+
+
+class RequestStats(threading.local):
+    """
+    A class to collect the database usage of the request handled by the
+    current thread.
+    Usage is only collected between start and reset, so threads that don't
+    handle requests, like executors and command line tools, don't collect
+    their queries forever.
+
+    Attributes:
+    active (bool): True while a request is handled by the thread
+    queries (List(list)): executed queries with their run time in seconds
+    connections (int): number of opened database connections
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def start(self):
+        """
+        Forget the collected usage and start collecting it for a new request.
+        """
+        self.reset()
+        self.active = True
+
+    def reset(self):
+        """
+        Forget the collected usage and stop collecting it.
+        """
+        self.active = False
+        self.queries = []
+        self.connections = 0
+
+    def query_time(self):
+        """
+        Return the time spent on queries.
+
+        Returns:
+        float: run time of all queries in seconds
+        """
+        return sum(duration for _, duration in self.queries)
+
+
+REGISTRY = []
+
+REQUESTS = Counter("blog_requests_total", "Handled requests.",
+                   ("endpoint", "status"))
+REQUEST_TIME = Histogram("blog_request_seconds", "Latency of requests.",
+                         ("endpoint", ))
+TEMPLATE_TIME = Histogram("blog_template_render_seconds",
+                          "Time spent rendering templates.", ("template", ))
+SEARCH_TIME = Histogram("blog_search_seconds", "Time spent on searches.")
+SEARCH_CACHE = Counter("blog_search_cache_total",
+                       "Lookups of cached searches.", ("result", ))
+QUERIES = Counter("blog_db_queries_total", "Executed database queries.")
+QUERY_TIME = Histogram("blog_db_query_seconds",
+                       "Time spent on database queries per request.",
+                       ("endpoint", ))
+QUERY_COUNT = Histogram("blog_db_queries_per_request",
+                        "Database queries per request.", ("endpoint", ),
+                        (1, 2, 5, 10, 20, 50, 100, 500))
+CONNECTIONS = Counter("blog_db_connections_total",
+                      "Opened database connections.")
+
+request_stats = RequestStats()
+
+
+def record_query(query, duration):
+    """
+    Record an executed database query.
+
+    Parameters:
+    query (str): executed query
+    duration (float): run time of the query in seconds
+    """
+    QUERIES.inc()
+    if request_stats.active:
+        request_stats.queries.append([query, duration])
+
+
+def record_fetch(duration):
+    """
+    Add the time spent fetching rows to the last executed query.
+
+    Parameters:
+    duration (float): time spent fetching in seconds
+    """
+    if request_stats.queries != []:
+        request_stats.queries[-1][1] += duration
+
+
+def record_connection():
+    """
+    Record an opened database connection.
+    """
+    CONNECTIONS.inc()
+    request_stats.connections += 1
+
+
+def render():
+    """
+    Render all metrics in the Prometheus text format.
+
+    Returns:
+    str: formatted metrics
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,80 +1,458 @@
+from contextlib import contextmanager
+import html
 import os
 import re
+import threading
+import time
 
 from whoosh import scoring
-from whoosh.index import create_in, open_dir
+from whoosh.index import create_in, exists_in, open_dir
 from whoosh.fields import Schema, TEXT, ID
 from whoosh.qparser import QueryParser
 
+from cache import TTLCache
 import config
 from database import Database
+import metrics
 
-CLEANR = re.compile('<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});')
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
+SCHEMA = Schema(title=TEXT(stored=True),
+                path=ID(stored=True, unique=True), content=TEXT(stored=True))
 
-def remove_html_tags(text):
+INDEX_COUNTER = "index"
+
+db = Database()
+
+
+@contextmanager
+def index_lock():
     """
-    Convert a text from html formatted to unformatted.
+    Hold a lock that serializes writes to the index data across processes.
+    Without fcntl (on Windows) only the index locks of Whoosh are used.
+    """
+    if not os.path.exists(config.INDEX_DIR):
+        os.makedirs(config.INDEX_DIR, exist_ok=True)
+    with open(os.path.join(config.INDEX_DIR, "write.lock"), "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def entry_document(entry):
+    """
+    Create the fields of the index document of an entry.
 
     Parameters:
-    text (str): text to clean
+    entry (Entry): entry to create the document for, selected with the text
+        without html
 
     Returns:
-    str: text without html tags
+    dict: fields of the document
+    """
+    author = entry.user.name if entry.user is not None else ""
+    text = entry.item.name + " " + (entry.item.date or "") + " " + \
+        entry.plain + " by " + author + " " + entry.date
+    return dict(title=entry.item.name, path=str(entry.id), content=text)
+
+
+class WhooshBackend():
+    """
+    A class to search entries with a Whoosh index stored in the index
+    directory.
+    One searcher is shared in the process and only reopened if the index
+    counter changed, as a rebuilt index starts over with the first Whoosh
+    generation.
+    Whoosh searchers are not safe to use from multiple threads, so searches
+    are serialized, which costs little as scoring is bound by the GIL anyway.
+
+    Attributes:
+    ix (Index): index data that is searched
+    searcher (Searcher): searcher of the current index generation
+    generation (int): index counter the searcher was opened at
+    lock (Lock): lock that serializes the usage of the searcher
+    """
+
+    def __init__(self):
+        self.ix = None
+        self.searcher = None
+        self.generation = None
+        self.lock = threading.Lock()
+        FTS5Backend.drop_triggers()
+
+    def create_index(self):
+        """
+        Create the index data to search all entries.
+
+        Returns:
+        Index: the newly created index
+        """
+        with index_lock():
+            return self.build_index()
+
+    def build_index(self):
+        """
+        Create the index data to search all entries while the index lock is
+        held.
+
+        Returns:
+        Index: the newly created index
+        """
+        ix = create_in(config.INDEX_DIR, SCHEMA)
+        writer = ix.writer(limitmb=config.INDEX_MEMORY)
+        for entry in db.get_entries(False, True):
+            writer.add_document(**entry_document(entry))
+        writer.commit()
+        return ix
+
+    def get_index(self):
+        """
+        Open the index data, create it if it doesn't exist or is outdated.
+
+        Returns:
+        Index: the index data to search all entries
+        """
+        if os.path.exists(config.INDEX_DIR) and exists_in(config.INDEX_DIR):
+            ix = open_dir(config.INDEX_DIR)
+            if ix.schema["path"].unique:
+                return ix
+        with index_lock():
+            # another process may have created it while waiting for the lock
+            if exists_in(config.INDEX_DIR):
+                ix = open_dir(config.INDEX_DIR)
+                if ix.schema["path"].unique:
+                    return ix
+            return self.build_index()
+
+    def add_entry(self, entry):
+        """
+        Add an entry to the index data or update it if it is already indexed.
+
+        Parameters:
+        entry (Entry): entry to add
+        """
+        ix = self.get_index()
+        with index_lock():
+            writer = ix.writer()
+            writer.update_document(**entry_document(entry))
+            writer.commit()
+
+    def remove_entry(self, ident):
+        """
+        Remove an entry from the index data.
+
+        Parameters:
+        ident (int): id of the entry to remove
+        """
+        ix = self.get_index()
+        with index_lock():
+            writer = ix.writer()
+            writer.delete_by_term("path", str(ident))
+            writer.commit()
+
+    def search(self, query_str, number, page=1):
+        """
+        Search for a given term and return a page of the best matches.
+
+        Parameters:
+        query_str (str): term to search for
+        number (int): number of results per page
+        page (int): number of the page starting with 1
+
+        Returns:
+        tuple: ids of the matching entries and html formatted snippets of
+            their matching text, True if there are more pages
+        """
+        with self.lock:
+            generation = db.get_counter(INDEX_COUNTER)
+            if self.searcher is None or generation != self.generation:
+                if self.searcher is not None:
+                    self.searcher.close()
+                self.ix = self.get_index()
+                self.searcher = self.ix.searcher(weighting=scoring.BM25F)
+                self.generation = generation
+            query = QueryParser("content", self.ix.schema).parse(query_str)
+            matches = self.searcher.search_page(query, page, pagelen=number)
+            if page > matches.pagecount:
+                return [], False
+            return [(int(match["path"]), match.highlights("content"))
+                    for match in matches], not matches.is_last_page()
+
+
+class FTS5Backend():
+    """
+    A class to search entries with an SQLite FTS5 table in the database.
+    The table is kept in sync by triggers on the entry table, so the index is
+    updated in the same transaction as the entries.
+
+    Attributes:
+    FTS_TABLE (str): name of the full-text search table
+    TRIGGERS (List(str)): names of the triggers for inserts, deletes, updates
     """
-    res = re.sub(CLEANR, '', text)
-    return res
+
+    FTS_TABLE = "ENTRIES_FTS"
+    TRIGGERS = ["ENTRIES_FTS_INSERT", "ENTRIES_FTS_DELETE",
+                "ENTRIES_FTS_UPDATE"]
+
+    def __init__(self):
+        self.setup_index()
+
+    @classmethod
+    def drop_triggers(cls):
+        """
+        Remove the triggers that keep the full-text search table in sync.
+        The table is filled again once the triggers are recreated.
+        """
+        conn = db.connect()
+        for trigger in cls.TRIGGERS:
+            conn.execute("DROP TRIGGER IF EXISTS " + trigger)
+        conn.commit()
+
+    def document_query(self, entry):
+        """
+        Return the query that selects the index documents of entries.
+
+        Parameters:
+        entry (str): name of the entry row to select the documents for
+
+        Returns:
+        str: query selecting the rowid, title and content of the documents
+        """
+        return "SELECT " + entry + ".id, i.name, i.name || ' ' || i.date " + \
+            "|| ' ' || " + entry + ".plain || ' by ' || " + \
+            "COALESCE(u.name, '') || ' ' || " + entry + ".date FROM " + \
+            db.ITEM_TABLE_FILE + " AS i LEFT JOIN " + db.USER_TABLE_FILE + \
+            " AS u ON u.id = " + entry + ".user_id WHERE i.id = " + entry + \
+            ".item_id"
+
+    def setup_index(self):
+        """
+        Create the full-text search table and its triggers if they don't
+        exist yet or the triggers select outdated documents, the table is
+        filled again whenever the triggers are created.
+        """
+        conn = db.connect()
+        crs = conn.cursor()
+        insert = "INSERT INTO " + self.FTS_TABLE + "(rowid, title, content) "
+        delete = "DELETE FROM " + self.FTS_TABLE + " WHERE rowid = old.id; "
+        insert_trigger = "CREATE TRIGGER " + self.TRIGGERS[0] + \
+            " AFTER INSERT ON " + db.ENTRY_TABLE_FILE + " BEGIN " + insert + \
+            self.document_query("new") + "; END"
+        # serialize the setup of concurrently starting processes
+        crs.execute("BEGIN IMMEDIATE")
+        query = "SELECT sql FROM sqlite_master WHERE type = 'trigger' " \
+            "AND name = ?"
+        crs.execute(query, (self.TRIGGERS[0], ))
+        fetched = crs.fetchone()
+        if fetched is not None and fetched[0] == insert_trigger:
+            conn.commit()
+            return
+        for trigger in self.TRIGGERS:
+            crs.execute("DROP TRIGGER IF EXISTS " + trigger)
+        crs.execute("CREATE VIRTUAL TABLE IF NOT EXISTS " + self.FTS_TABLE +
+                    " USING fts5(title, content)")
+        crs.execute(insert_trigger)
+        crs.execute("CREATE TRIGGER IF NOT EXISTS " + self.TRIGGERS[1] +
+                    " AFTER DELETE ON " + db.ENTRY_TABLE_FILE + " BEGIN " +
+                    delete + "END")
+        crs.execute("CREATE TRIGGER IF NOT EXISTS " + self.TRIGGERS[2] +
+                    " AFTER UPDATE ON " + db.ENTRY_TABLE_FILE + " BEGIN " +
+                    delete + insert + self.document_query("new") + "; END")
+        self.fill_index(crs)
+        conn.commit()
+
+    def fill_index(self, crs):
+        """
+        Replace the contents of the full-text search table with all entries.
+
+        Parameters:
+        crs (Cursor): cursor of the transaction to fill the table in
+        """
+        crs.execute("DELETE FROM " + self.FTS_TABLE)
+        query = self.document_query("e").replace(
+            " FROM ", " FROM " + db.ENTRY_TABLE_FILE + " AS e, ", 1)
+        crs.execute("INSERT INTO " + self.FTS_TABLE +
+                    "(rowid, title, content) " + query)
+
+    def create_index(self):
+        """
+        Rebuild the full-text search table from all entries.
+        """
+        conn = db.connect()
+        self.fill_index(conn.cursor())
+        conn.commit()
+
+    def add_entry(self, entry):
+        """
+        Add an entry to the index, which the triggers already did.
+
+        Parameters:
+        entry (Entry): entry to add
+        """
+
+    def remove_entry(self, ident):
+        """
+        Remove an entry from the index, which the triggers already did.
+
+        Parameters:
+        ident (int): id of the entry to remove
+        """
+
+    def search(self, query_str, number, page=1):
+        """
+        Search for a given term and return a page of the best matches ranked
+        by bm25.
+
+        Parameters:
+        query_str (str): term to search for
+        number (int): number of results per page
+        page (int): number of the page starting with 1
+
+        Returns:
+        tuple: ids of the matching entries and html formatted snippets of
+            their matching text, True if there are more pages
+        """
+        terms = re.findall(r"\w+", query_str)
+        if terms == []:
+            return [], False
+        match = " ".join('"' + term + '"' for term in terms)
+        crs = db.connect().cursor()
+        query = "SELECT rowid, snippet(" + self.FTS_TABLE + \
+            ", 1, char(2), char(3), '...', 16) FROM " + self.FTS_TABLE + \
+            " WHERE " + self.FTS_TABLE + " MATCH ? ORDER BY rank " + \
+            "LIMIT ? OFFSET ?"
+        crs.execute(query, (match, number + 1, (page - 1) * number))
+        rows = crs.fetchall()
+        return [(ident, html.escape(snippet).replace("\x02", "<b>")
+                 .replace("\x03", "</b>"))
+                for ident, snippet in rows[:number]], len(rows) > number
+
+
+BACKENDS = {"whoosh": WhooshBackend, "fts5": FTS5Backend}
+
+backend = BACKENDS[config.SEARCH_BACKEND]()
+
+search_cache = TTLCache(config.SEARCH_CACHE_SIZE, config.SEARCH_CACHE_TTL) \
+    if config.SEARCH_CACHE_SIZE > 0 else None
 
 
 def create_search_index():
     """
     Create the index data to search all entries.
+    This rebuilds the whole index and is only needed for maintenance, new and
+    deleted entries are indexed by add_entry_to_index and
+    remove_entry_from_index.
     """
-    db = Database()
-    schema = Schema(title=TEXT(stored=True),
-                    path=ID(stored=True), content=TEXT(stored=True))
-    if not os.path.exists(config.INDEX_DIR):
-        os.mkdir(config.INDEX_DIR)
-    ix = create_in(config.INDEX_DIR, schema)
-    writer = ix.writer()
-    for entry in db.get_entries():
-        path = str(entry.id)
-        text = entry.item.name + " " + entry.item.date + " " + entry.text + \
-            " by " + entry.user.name + " " + entry.date
-        writer.add_document(title=entry.item.name, path=path, content=text)
-    writer.commit()
+    backend.create_index()
+    db.increase_counter(INDEX_COUNTER)
+
+
+def add_entry_to_index(entry):
+    """
+    Add an entry to the index data or update it if it is already indexed.
+
+    Parameters:
+    entry (Entry): entry to add
+    """
+    backend.add_entry(entry)
+    db.increase_counter(INDEX_COUNTER)
 
 
-def ft_search_times(query_str, number):
+def remove_entry_from_index(ident):
+    """
+    Remove an entry from the index data.
+
+    Parameters:
+    ident (int): id of the entry to remove
+    """
+    backend.remove_entry(ident)
+    db.increase_counter(INDEX_COUNTER)
+
+
+def get_index_generation():
+    """
+    Return the generation of the index, which changes whenever entries are
+    indexed or removed.
+
+    Returns:
+    int: generation of the index
+    """
+    return db.get_counter(INDEX_COUNTER)
+
+
+def search_matches(query_str, number, page=1):
+    """
+    Search for a given term and return a page of the best matches, cached
+    until the index changes.
+    Queries are normalized by collapsing whitespace only, as the operators
+    of the query parser are case sensitive.
+
+    Parameters:
+    query_str (str): term to search for
+    number (int): number of results per page
+    page (int): number of the page starting with 1
+
+    Returns:
+    tuple: ids of the matching entries and html formatted snippets of their
+        matching text, True if there are more pages
+    """
+    key = (get_index_generation(), " ".join(query_str.split()), number, page)
+    if search_cache is not None:
+        matches = search_cache.get(key)
+        if matches is not None:
+            metrics.SEARCH_CACHE.inc(1, "hit")
+            return matches
+        metrics.SEARCH_CACHE.inc(1, "miss")
+    start = time.perf_counter()
+    matches = backend.search(key[1], number, page)
+    metrics.SEARCH_TIME.observe(time.perf_counter() - start)
+    if search_cache is not None:
+        search_cache.set(key, matches)
+    return matches
+
+
+def ft_search_times(query_str, number, page=1):
     """
     Search for a given term and returns a specific amount of results.
 
     Parameters:
     query_str (str): term to search for
-    number (int): number of results to return
+    number (int): number of results per page
+    page (int): number of the page starting with 1
 
     Returns:
-    List(Entry): list of entries that matched the search
+    tuple: list of entries that matched the search, True if there are more
+        pages
     """
-    ix = open_dir(config.INDEX_DIR)
-    results = []
-    db = Database()
-    with ix.searcher(weighting=scoring.BM25F) as s:
-        query = QueryParser("content", ix.schema).parse(query_str)
-        matches = s.search(query, limit=number)
-        for match in matches:
-            results.append(db.get_entry_by_id(match["path"]))
-    return results
+    matches, more = search_matches(query_str, number, page)
+    results = db.get_entries_by_ids([ident for ident, _ in matches], False)
+    snippets = dict(matches)
+    for entry in results:
+        entry.set_snippet(snippets[entry.id])
+    return results, more
 
 
-def ft_search(query_str):
+def ft_search(query_str, page=1):
     """
     Search for a given term and show the predefined amount of results.
 
     Parameters:
     query_str (str): term to search for
+    page (int): number of the page starting with 1
 
     Returns:
-    List(Entry): list of entries that matched the search
+    tuple: list of entries that matched the search, True if there are more
+        pages
     """
-    return ft_search_times(query_str, config.SEARCH_NUMBER)
+    return ft_search_times(query_str, config.SEARCH_NUMBER, page)
+
+
+if __name__ == "__main__":
+    create_search_index()
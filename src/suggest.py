@@ -0,0 +1,141 @@
+from bisect import bisect_left, insort
+import threading
+import time
+
+import config
+
+
+def normalize(text):
+    """
+    Normalize a text for prefix matching.
+
+    Parameters:
+    text (str): text to normalize
+
+    Returns:
+    str: lower case text with collapsed whitespace
+    """
+    return " ".join(text.casefold().split())
+
+
+class SuggestionIndex():
+    """
+    A class to suggest items by prefixes of their names and their years.
+    Every word of a name starts a key, so names match from any word, and the
+    keys are kept in a sorted list that is searched with bisect.
+    The index of a process learns about the items it creates itself and is
+    rebuilt from the database in a background thread after the refresh
+    interval to pick up items of other processes, the old keys are served
+    until the rebuild is done.
+
+    Attributes:
+    loader (function): function that returns all items
+    keys (List(tuple)): normalized keys with the ids of their items, sorted
+    items (dict): items by their ids
+    built (float): monotonic time of the last rebuild, None before the first
+    lock (Lock): lock that guards the keys and items
+    building (Lock): lock that is held while a background rebuild runs
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.keys = []
+        self.items = {}
+        self.built = None
+        self.lock = threading.Lock()
+        self.building = threading.Lock()
+
+    def item_keys(self, item):
+        """
+        Return the keys an item is found by.
+
+        Parameters:
+        item (Item): item to return the keys of
+
+        Returns:
+        List(tuple): keys with the id of the item
+        """
+        words = normalize(item.name).split(" ")
+        keys = [(" ".join(words[pos:]), item.id) for pos in range(len(words))]
+        if item.date:
+            keys.append((normalize(item.date), item.id))
+        return keys
+
+    def build(self):
+        """
+        Replace the index with all items returned by the loader.
+        """
+        items = {item.id: item for item in self.loader()}
+        keys = sorted(key for item in items.values()
+                      for key in self.item_keys(item))
+        with self.lock:
+            self.keys = keys
+            self.items = items
+            self.built = time.monotonic()
+
+    def refresh(self):
+        """
+        Start rebuilding the index in a background thread if the refresh
+        interval passed and no other rebuild is running.
+        """
+        if time.monotonic() - self.built <= config.SUGGEST_REFRESH or \
+                not self.building.acquire(blocking=False):
+            return
+        threading.Thread(target=self.rebuild, name="suggest",
+                         daemon=True).start()
+
+    def rebuild(self):
+        """
+        Rebuild the index and allow the next rebuild afterwards.
+        """
+        try:
+            self.build()
+        finally:
+            self.building.release()
+
+    def add(self, item):
+        """
+        Add a new item to the index.
+
+        Parameters:
+        item (Item): item to add
+        """
+        with self.lock:
+            if item.id in self.items:
+                return
+            self.items[item.id] = item
+            for key in self.item_keys(item):
+                insort(self.keys, key)
+
+    def suggest(self, prefix, number):
+        """
+        Return the items with a word of the name or the year starting with a
+        given prefix.
+
+        Parameters:
+        prefix (str): start of the name or year
+        number (int): maximum number of items to return
+
+        Returns:
+        List(Item): matching items ordered by their matching keys
+        """
+        if self.built is None:
+            self.build()
+        else:
+            self.refresh()
+        prefix = normalize(prefix)
+        if prefix == "":
+            return []
+        res = []
+        seen = set()
+        with self.lock:
+            pos = bisect_left(self.keys, (prefix, ))
+            while pos < len(self.keys) and len(res) < number:
+                key, ident = self.keys[pos]
+                if not key.startswith(prefix):
+                    break
+                if ident not in seen:
+                    seen.add(ident)
+                    res.append(self.items[ident])
+                pos += 1
+        return res